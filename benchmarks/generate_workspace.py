@@ -0,0 +1,108 @@
+import argparse
+import json
+import random
+from dataclasses import asdict
+from pathlib import Path
+
+from infinote.box_index import INDEX_FILENAME, BoxIndex
+from infinote.text_object import BoxInfo
+
+_words = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def _random_note(rng: random.Random, num_lines: int):
+    # outline-like markdown: bullets with up to three indent levels,
+    # some of them highlighted (see Config.highlight_lines_regex)
+    lines = []
+    for _ in range(num_lines):
+        indent = "  " * rng.choice([0, 0, 1, 1, 2])
+        mark = "! " if rng.random() < 0.05 else ""
+        words = " ".join(rng.choices(_words, k=rng.randint(2, 12)))
+        lines.append(f"{indent}- {mark}{words}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_workspace(
+    workspace_dir: Path,
+    num_notes: int = 500,
+    num_groups: int = 3,
+    max_depth: int = 3,
+    lines_per_note: int = 10,
+    old_format: bool = False,
+    seed: int = 0,
+):
+    # writes a workspace which infinote can open: group dirs with numbered .md notes,
+    # and their box infos in the index (or with old_format, in meta.json and
+    # boxinfo/<num>.json files, which are migrated into the index on load)
+    # about a third of the notes are roots, scattered over the plane, the rest are
+    # children of random notes, at most max_depth levels deep
+    # returns the group dirs
+    rng = random.Random(seed)
+    workspace_dir.mkdir(parents=True, exist_ok=True)
+    assert not any(workspace_dir.iterdir()), f"workspace_dir not empty: {workspace_dir}"
+
+    group_dirs = [workspace_dir / f"group{i}" for i in range(num_groups)]
+    hues = {group_dir.name: rng.randint(60, 310) for group_dir in group_dirs}
+    for group_dir in group_dirs:
+        group_dir.mkdir()
+
+    boxes = {}
+    depths = {}
+    # notes which can still get children
+    possible_parents = []
+    last_file_nums = {group_dir: 0 for group_dir in group_dirs}
+    for i in range(num_notes):
+        group_dir = group_dirs[i % num_groups]
+        last_file_nums[group_dir] += 1
+        full_filename = group_dir / f"{last_file_nums[group_dir]}.md"
+        rel_filename = full_filename.relative_to(workspace_dir).as_posix()
+        num_lines = rng.randint(1, 2 * lines_per_note - 1)
+        full_filename.write_text(_random_note(rng, num_lines))
+
+        if not possible_parents or rng.random() < 1 / 3:
+            box_info = BoxInfo(plane_pos=(rng.uniform(100, 3000), rng.uniform(0, 2000)))
+            depths[rel_filename] = 0
+        else:
+            parent = rng.choice(possible_parents)
+            box_info = BoxInfo(parent_filename=parent)
+            depths[rel_filename] = depths[parent] + 1
+        if depths[rel_filename] < max_depth:
+            possible_parents.append(rel_filename)
+        boxes[rel_filename] = asdict(box_info)
+
+    active_text = next(iter(boxes), None)
+    if old_format:
+        meta = {name: dict(hue=hue) for name, hue in hues.items()}
+        meta["active_text"] = active_text
+        (workspace_dir / "meta.json").write_text(json.dumps(meta))
+        for rel_filename, info in boxes.items():
+            full_filename = workspace_dir / rel_filename
+            info_dir = full_filename.parent / "boxinfo"
+            info_dir.mkdir(exist_ok=True)
+            (info_dir / f"{full_filename.stem}.json").write_text(json.dumps(info))
+    else:
+        box_index = BoxIndex(workspace_dir / INDEX_FILENAME)
+        box_index.save(boxes, hues, dict(active_text=active_text))
+        box_index.close()
+    return group_dirs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic infinote workspace")
+    parser.add_argument("workspace", type=Path, help="Directory to create the workspace in")
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--groups", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=3, help="Max depth of the child trees")
+    parser.add_argument("--lines", type=int, default=10, help="Mean number of lines per note")
+    parser.add_argument("--old-format", action="store_true", help="Write json box infos")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_workspace(
+        args.workspace,
+        num_notes=args.notes,
+        num_groups=args.groups,
+        max_depth=args.depth,
+        lines_per_note=args.lines,
+        old_format=args.old_format,
+        seed=args.seed,
+    )
@@ -0,0 +1,223 @@
+import os
+
+# the view is driven without a window
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pynvim
+from PySide6.QtWidgets import QApplication
+
+from benchmarks.generate_workspace import generate_workspace
+from infinote.config import Config
+from infinote.persistence import load_scene, save_scene
+from infinote.view import GraphicView
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+
+# typed in insert mode, one key at a time
+_typed_keys = list("the quick brown fox ") + ["<CR>"] + list("- jumps over ") + ["<BS>"] * 3
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p95 = samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+    return p50, p95
+
+
+def _start_nvim():
+    # the same as in main.main
+    custom_vimrc = (Path(__file__).parent.parent / "infinote" / "required.vim").resolve()
+    nvim = pynvim.attach(
+        "child", argv=["/usr/bin/env", "nvim", "--embed", "--headless", "-u", custom_vimrc]
+    )
+    nvim.ui_attach(80, 100, True)
+    return nvim
+
+
+def _repaint(view):
+    # paint synchronously, so the measured time includes painting the frame
+    view.viewport().repaint()
+
+
+def _settle(app, view):
+    # wait for the submitted nvim jobs, and run their GUI parts, which may submit more
+    # (f.e. a jump to a placeholder first opens its file, and then jumps)
+    while True:
+        view.nvim_worker.wait()
+        app.processEvents()
+        if view.nvim_worker.is_idle():
+            return
+
+
+def _measure_keystrokes(app, view, num_keys):
+    # each key goes through the same steps as typing: sending it to nvim,
+    # fetching the new state, redrawing and painting
+    samples = []
+    for i in range(num_keys):
+        keys = [(_typed_keys[i % len(_typed_keys)],) * 2]
+        start = time.perf_counter()
+        view.nvim_worker.submit(lambda: view.key_handler.handle_keys(keys))
+        view.buf_handler.update_all_texts()
+        _settle(app, view)
+        _repaint(view)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _measure_zoom(app, view, num_frames):
+    # zoom out and back in, like scrolling the wheel
+    samples = []
+    for i in range(num_frames):
+        zoom_factor = 0.97 if i < num_frames // 2 else 1 / 0.97
+        start = time.perf_counter()
+        view.global_scale *= zoom_factor
+        view._on_view_moved()
+        _settle(app, view)
+        _repaint(view)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _measure_jumps(app, view, num_jumps):
+    samples = []
+    directions = ["right", "down", "left", "up"]
+    for i in range(num_jumps):
+        start = time.perf_counter()
+        view.jump_to_neighbor(directions[i % len(directions)])
+        _settle(app, view)
+        _repaint(view)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_benchmark(workspace_dir, num_keys=100, num_zoom_frames=100, num_jumps=40):
+    # returns {metric name: seconds}
+    group_dir = sorted(d for d in workspace_dir.iterdir() if d.is_dir())[0]
+    # (nvim and infinote expect to run in the workspace, like in main.main)
+    previous_cwd = Path.cwd()
+    os.chdir(workspace_dir)
+    results = {}
+
+    nvim = _start_nvim()
+    assert len(nvim.buffers) == 1, "we require nvim to start with one buffer"
+    app = QApplication.instance() or QApplication(sys.argv)
+    view = GraphicView(nvim, group_dir)
+    view.resize(1600, 900)
+    view.show()
+
+    start = time.perf_counter()
+    buf_handler = view.buf_handler
+    load_scene(buf_handler, group_dir)
+    buf_handler.jumplist = [None, nvim.current.buffer.number]
+    view.global_scale = view.get_scale_centered_on_text(buf_handler.get_current_text())
+    buf_handler.reposition_all()
+    buf_handler.to_redraw.update(buf_handler.buf_num_to_text.keys())
+    buf_handler.update_all_texts()
+    _settle(app, view)
+    _repaint(view)
+    results["load_scene"] = time.perf_counter() - start
+
+    for name, samples in [
+        ("keystroke", _measure_keystrokes(app, view, num_keys)),
+        ("zoom frame", _measure_zoom(app, view, num_zoom_frames)),
+        ("neighbor jump", _measure_jumps(app, view, num_jumps)),
+    ]:
+        p50, p95 = _percentiles(samples)
+        results[f"{name} p50"] = p50
+        results[f"{name} p95"] = p95
+
+    # save all the box infos, not only the few changed ones
+    for text in buf_handler.get_texts():
+        text.dirty = True
+    start = time.perf_counter()
+    save_scene(buf_handler, nvim, workspace_dir)
+    results["save_scene"] = time.perf_counter() - start
+
+    view.llm_engine.cancel_all()
+    view.nvim_worker.stop()
+    nvim.quit("qa!")
+    os.chdir(previous_cwd)
+    return results
+
+
+def check_regressions(results, baseline, threshold):
+    # returns the metrics which are slower than the baseline by more than the threshold
+    return [
+        name
+        for name, value in results.items()
+        if name in baseline and value > baseline[name] * (1 + threshold)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark infinote on a synthetic workspace")
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--groups", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=3, help="Max depth of the child trees")
+    parser.add_argument("--lines", type=int, default=10, help="Mean number of lines per note")
+    parser.add_argument("--old-format", action="store_true", help="Load json box infos")
+    parser.add_argument("--lazy", action="store_true", help="Use Config.lazy_materialization")
+    parser.add_argument("--keys", type=int, default=100)
+    parser.add_argument("--zoom-frames", type=int, default=100)
+    parser.add_argument("--jumps", type=int, default=40)
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Allowed slowdown, as a fraction"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as the new baseline"
+    )
+    parser.add_argument("--baselines", type=Path, default=BASELINES_PATH)
+    args = parser.parse_args()
+
+    Config.lazy_materialization = args.lazy
+    # the baselines are kept separately for each workspace shape
+    scenario = (
+        f"notes={args.notes} groups={args.groups} depth={args.depth} lines={args.lines}"
+        f"{' old_format' if args.old_format else ''}{' lazy' if args.lazy else ''}"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workspace_dir = Path(tmp_dir) / "workspace"
+        generate_workspace(
+            workspace_dir,
+            num_notes=args.notes,
+            num_groups=args.groups,
+            max_depth=args.depth,
+            lines_per_note=args.lines,
+            old_format=args.old_format,
+        )
+        results = run_benchmark(workspace_dir, args.keys, args.zoom_frames, args.jumps)
+
+    baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+    baseline = baselines.get(scenario, {})
+    print(f"scenario: {scenario}")
+    if not baseline and not args.save_baseline:
+        print("no baseline for this scenario yet, store one with --save-baseline")
+    for name, value in results.items():
+        line = f"{name:>18}: {value * 1000:9.2f}ms"
+        if name in baseline:
+            change = value / baseline[name] - 1
+            line += f"  (baseline {baseline[name] * 1000:9.2f}ms, {change:+.0%})"
+        print(line)
+
+    if args.save_baseline:
+        baselines[scenario] = results
+        args.baselines.write_text(json.dumps(baselines, indent=4))
+        print(f"baseline saved to: {args.baselines.as_posix()}")
+        return
+
+    regressions = check_regressions(results, baseline, args.threshold)
+    if regressions:
+        print(f"regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import json
+import sqlite3
+from pathlib import Path
+
+from infinote.text_object import BoxInfo
+
+# one file per workspace holding all the box infos, group hues and other metadata,
+# so that loading is one read instead of a small file open per note
+INDEX_FILENAME = "index.sqlite"
+
+_schema = """
+CREATE TABLE IF NOT EXISTS boxes (
+    filename TEXT PRIMARY KEY,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS groups (
+    name TEXT PRIMARY KEY,
+    hue INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class BoxIndex:
+    def __init__(self, index_path: Path):
+        self.index_path = index_path
+        self.conn = sqlite3.connect(index_path)
+        with self.conn:
+            self.conn.executescript(_schema)
+
+    def close(self):
+        self.conn.close()
+
+    def load_boxes(self) -> dict[str, BoxInfo]:
+        # filenames are relative to the workspace dir, the same as parent_filename
+        rows = self.conn.execute("SELECT filename, info FROM boxes")
+        fields = BoxInfo.__annotations__
+        boxes = {}
+        for filename, info in rows:
+            info = json.loads(info)
+            # ignore fields which are not known (anymore)
+            boxes[filename] = BoxInfo(**{k: v for k, v in info.items() if k in fields})
+        return boxes
+
+    def load_hues(self) -> dict[str, int]:
+        return dict(self.conn.execute("SELECT name, hue FROM groups"))
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def save(
+        self,
+        boxes: dict[str, dict],
+        hues: dict[str, int],
+        meta: dict,
+        deleted: list[str] = (),
+    ):
+        # write everything in one transaction, so the index is never half updated
+        # only the given boxes are written, the rest of the records stays untouched
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM boxes WHERE filename = ?", [(filename,) for filename in deleted]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO boxes (filename, info) VALUES (?, ?)",
+                [(filename, json.dumps(info)) for filename, info in boxes.items()],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO groups (name, hue) VALUES (?, ?)", hues.items()
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in meta.items()],
+            )
+
+
+def migrate_from_json(box_index: BoxIndex, workspace_dir: Path):
+    # import the old format: meta.json and a boxinfo/<num>.json file for each note
+    # the old files are left untouched, but from now on only the index is used
+    meta = json.loads((workspace_dir / "meta.json").read_text())
+    hues = {}
+    boxes = {}
+    for subdir in workspace_dir.iterdir():
+        if not subdir.is_dir() or subdir.name not in meta:
+            continue
+        hues[subdir.name] = meta[subdir.name]["hue"]
+        for full_filename in subdir.iterdir():
+            if full_filename.suffix not in [".md", ".aichat"]:
+                continue
+            info_path = subdir / "boxinfo" / f"{full_filename.stem}.json"
+            if not info_path.exists():
+                continue
+            rel_filename = full_filename.relative_to(workspace_dir).as_posix()
+            boxes[rel_filename] = json.loads(info_path.read_text())
+
+    box_index.save(boxes, hues, dict(active_text=meta.get("active_text")))
+    print(f"migrated {len(boxes)} box infos into {box_index.index_path}")
@@ -1,38 +1,131 @@
-from collections import defaultdict, deque
+from collections import defaultdict
 from pathlib import Path
-from typing import List
 
-from boltons.dictutils import OrderedMultiDict
-from PySide6.QtCore import QPointF
+from PySide6.QtCore import QPointF, QTimer
 
 from infinote.config import Config
+from infinote.scene_graph import SceneGraph
+from infinote.spatial_index import SpatialIndex
 from infinote.text_object import BoxInfo, DraggableText, EditorBox, is_buf_empty
+from infinote.tracing import KEY_TO_PAINT, traced, tracer
+
+# writes the modified buffers among the given ones, all in one call
+# (and the new ones whose file doesn't exist yet, even if they're empty and unmodified)
+# buffers whose name doesn't match the expected filename are skipped and returned
+_write_modified_buffers_lua = """
+local mismatched = {}
+for _, item in ipairs(...) do
+    local buf, filename = item[1], item[2]
+    if vim.api.nvim_buf_is_valid(buf)
+        and (vim.bo[buf].modified or vim.fn.filereadable(filename) == 0) then
+        if vim.fn.fnamemodify(vim.api.nvim_buf_get_name(buf), ":p") == filename then
+            vim.api.nvim_buf_call(buf, function() vim.cmd("silent write") end)
+        else
+            table.insert(mismatched, buf)
+        end
+    end
+end
+return mismatched
+"""
+
+# switch to the tab which shows the buffer, trying the cached one (if any) first
+# returns the handle of that tab, or nil if no tab shows the buffer
+_jump_to_buffer_tab_lua = """
+local buf, cached_tab = ...
+local function shows_buf(tab)
+    for _, win in ipairs(vim.api.nvim_tabpage_list_wins(tab)) do
+        if vim.api.nvim_win_get_buf(win) == buf then
+            return true
+        end
+    end
+    return false
+end
+local found
+if cached_tab ~= nil and vim.api.nvim_tabpage_is_valid(cached_tab) and shows_buf(cached_tab) then
+    found = cached_tab
+else
+    for _, tab in ipairs(vim.api.nvim_list_tabpages()) do
+        if shows_buf(tab) then
+            found = tab
+            break
+        end
+    end
+end
+if found ~= nil then
+    vim.api.nvim_set_current_tabpage(found)
+end
+return found
+"""
 
 
 class BufferHandler:
+    # the state here has two owners: the nvim side is only used by the nvim calls,
+    # which run in the nvim worker (or during the load, before it runs), and the rest
+    # only in the GUI thread - jobs return plain data, which is applied in their on_done
+
     def __init__(self, nvim, view):
         self.nvim = nvim
 
         self.view = view
         self.jumplist = None  # must be set by view
         self.buf_num_to_text = {}
+        # relative filenames of the texts with buffers
+        self.filename_to_buf_num = {}
         self.forward_jumplist = []
-        self.last_file_nums = defaultdict(lambda: 0)
         self.savedir_hues = {}
         self.to_redraw = set()
-        self.parents = OrderedMultiDict()
+        # press times of the keys whose effects get drawn by the next update_all_texts
+        self.undrawn_key_times = []
+        # texts which have extmark labels drawn over them
+        self.labelled_buf_nums = set()
+        self.scene_graph = SceneGraph()
+        self.spatial_index = SpatialIndex()
+        self.box_index = None  # must be set by load_scene
+        # deleted texts, whose box infos need to be removed from the index
+        self.deleted_filenames = []
+        self.journal = None  # must be set by load_scene
+        # the nvim state of the last redraw, see apply_redraw
+        self.mode_info = None
+        self.num_buffers = 1
+        # numbers of the fetched states, in the order they were fetched, see absorb_state
+        self._state_num = 0
+        self._applied_state_num = 0
+        # texts without nvim buffers, only used with Config.lazy_materialization
+        self.dormant_texts = set()
+        # texts whose buffers are being opened or wiped in the nvim worker
+        self._texts_in_flight = set()
+        # mirror of the lines of attached buffers, updated with the changes reported by nvim
+        self.buf_lines = {}
+        # the nvim state as of the last snapshot, see absorb_state
+        self._snapshot = {}
+        # texts found stale while painting, handled in one pass after it, see remeasure_later
+        self._texts_to_remeasure = set()
+        self._texts_to_thumbnail = set()
+        self._deferred_pass_scheduled = False
+
+        # the nvim side
+        # the texts' buffers, as of the nvim calls done so far (so also the ones whose
+        # texts are not bound yet in the GUI), and the tab each of them is shown in
+        # (each text's buffer has its own tab, so jumps can switch to it directly)
+        self.buf_num_to_tab = {}
+        # the last text buffer which was current in nvim, see fetch_redraw_state
+        self._nvim_text_buf_num = None
+        self.last_file_nums = defaultdict(lambda: 0)
 
         # start in insert mode if not in vim mode
         if not Config.vim_mode:
             self.nvim.command("startinsert")
 
     def get_num_unbound_buffers(self):
-        return len(self.nvim.buffers) - len(self.buf_num_to_text)
+        # (as of the last redraw)
+        return self.num_buffers - len(self.buf_num_to_text)
 
-    def open_filename(self, box_info, filename=None, buffer=None):
+    def open_buffer(self, filename=None, buffer=None):
+        # the nvim part of creating a text: open the file, or the given buffer, in a new tab
+        # returns the buffer, and its folds and signs, for add_text
         if buffer is None and filename is not None:
             # no buffer provided, so open the one with the given filename
-            num_of_texts = len(self.buf_num_to_text)
+            num_of_texts = len(self.buf_num_to_tab)
             if num_of_texts == 0:
                 self.nvim.command(f"edit {filename}")
             elif num_of_texts == len(self.nvim.buffers):
@@ -40,6 +133,7 @@ class BufferHandler:
                 # this line is the loading time bottleneck - each call is 36ms
                 self.nvim.command(f"tabnew {filename}")
             buffer = self.nvim.current.buffer
+            self._send_input_on_creation(buffer, filename)
         elif buffer is not None and filename is None:
             # buffer provided, so open it
             self.nvim.command("tabnew")
@@ -48,129 +142,508 @@ class BufferHandler:
             self.nvim.command("bwipeout! #")
         else:
             raise ValueError("either buffer or filename must be provided")
-
-        text = DraggableText(box_info, self.nvim, buffer, filename, self.view, self.parents)
+        self.buf_num_to_tab[buffer.number] = self.nvim.api.get_current_tabpage()
+        # get folds and signs for potential future drawing
+        buf_info = self.nvim.exec_lua("return infinote_buf_info()")
+        self._attach_buffers([buffer.number])
+        return buffer, buf_info
+
+    def _send_input_on_creation(self, buffer, filename):
+        # optionally, send some input into a new file
+        if not is_buf_empty(buffer):
+            return
+        if filename.endswith(".md") and Config.input_on_creation:
+            self.nvim.command("startinsert")
+            self.nvim.input(Config.input_on_creation)
+        elif filename.endswith(".aichat") and Config.input_on_creation_aichat:
+            assert Path.cwd() == self.view.workspace_dir
+            file_pattern = "./**/*.md"
+            self.nvim.command("startinsert")
+            self.nvim.input(Config.input_on_creation_aichat.format(files_to_include=file_pattern))
+            # move to the second line, not changing the mode
+            self.nvim.current.window.cursor = [2, 0]
+
+    def add_text(self, box_info, filename, buffer, buf_info):
+        # the Qt part of creating a text, for a buffer opened with open_buffer
+        text = DraggableText(
+            box_info,
+            buffer,
+            filename,
+            self.view,
+            self.scene_graph,
+            init_folds=buf_info["folds"],
+            init_sign_lines=buf_info["sign_lines"],
+        )
         self.view.scene().addItem(text)
+        self.scene_graph.add(text)
+        self._bind(text, buffer)
+        # it's a new text, so it has to be saved
+        text.mark_dirty()
+        return text
 
+    def _bind(self, text, buffer):
+        # (the buffer is already attached, so its lines come with the next snapshot)
         self.buf_num_to_text[buffer.number] = text
-        return text
+        self.buf_lines[buffer.number] = []
+        if text.filename is not None:
+            self.filename_to_buf_num[text.get_rel_filename()] = buffer.number
+
+    def _unbind(self, buf_num):
+        # (its tab is closed by wiping the buffer)
+        text = self.buf_num_to_text.pop(buf_num)
+        if text.filename is not None:
+            self.filename_to_buf_num.pop(text.get_rel_filename(), None)
+        self.buf_lines.pop(buf_num, None)
+
+    def _attach_buffers(self, buf_nums):
+        # subscribe to the line changes of these buffers, see infinote.lua
+        self.nvim.exec_lua("infinote_attach(...)", buf_nums)
+
+    def _apply_changes(self, changes):
+        # update the lines mirror, returning the numbers of the changed buffers
+        changed = set()
+        for buf_num, (first, old_end, lines) in changes.items():
+            buf_num = int(buf_num)
+            if buf_num not in self.buf_lines:
+                continue
+            # (a new list, so that the states already fetched stay untouched)
+            old = self.buf_lines[buf_num]
+            self.buf_lines[buf_num] = old[:first] + lines + old[old_end:]
+            changed.add(buf_num)
+        return changed
+
+    def _batched_open(self, filenames, keep_current_tab=False):
+        # open many files at once, batching the tabnew calls into a few call_atomic
+        # requests, instead of paying the ~36ms round trip of open_buffer per file
+        # returns the buffers
+        if keep_current_tab:
+            current_tab = self.nvim.api.get_current_tabpage()
+
+        # with events ignored no autocmds or filetype detection run during the load
+        # (filetype of the other buffers is detected later, on their first BufEnter
+        # - see required.vim)
+        self.nvim.command("set eventignore=all")
+        try:
+            buffers = []
+            tabs = []
+            first_cmd = "edit" if len(self.buf_num_to_tab) == 0 else "$tabnew"
+            for i in range(0, len(filenames), Config.load_batch_size):
+                functions = []
+                for filename in filenames[i : i + Config.load_batch_size]:
+                    functions.append(["nvim_command", [f"{first_cmd} {filename}"]])
+                    functions.append(["nvim_get_current_buf", []])
+                    functions.append(["nvim_get_current_tabpage", []])
+                    first_cmd = "$tabnew"
+                results, errors = self.nvim.api.call_atomic(functions)
+                assert errors is None, errors
+                buffers.extend(results[1::3])
+                tabs.extend(results[2::3])
+            if keep_current_tab:
+                self.nvim.api.set_current_tabpage(current_tab)
+        finally:
+            self.nvim.command("set eventignore=")
+        # the current buffer was entered with events ignored, so it won't get
+        # a BufEnter until we leave it and come back
+        self.nvim.command("doautocmd BufEnter")
+        self.buf_num_to_tab.update(zip((buffer.number for buffer in buffers), tabs))
+        return buffers
+
+    def open_filenames(self, to_open):
+        # to_open is a list of (box_info, filename) pairs
+        if not to_open:
+            return []
+        buffers = self._batched_open([filename for _, filename in to_open])
+
+        texts = []
+        for (box_info, filename), buffer in zip(to_open, buffers):
+            # freshly opened files have no closed folds and no signs placed yet,
+            # so don't ask nvim for them one by one
+            text = DraggableText(
+                box_info,
+                buffer,
+                filename,
+                self.view,
+                self.scene_graph,
+                init_folds=[],
+                init_sign_lines=[],
+            )
+            self.view.scene().addItem(text)
+            self.scene_graph.add(text)
+            self._bind(text, buffer)
+            texts.append(text)
+        self._attach_buffers([buffer.number for buffer in buffers])
+        return texts
+
+    def add_dormant_texts(self, to_open):
+        # create texts which only have geometry, without opening their files in nvim
+        # they get their buffers later, in materialize_texts
+        texts = []
+        for box_info, filename in to_open:
+            text = DraggableText(box_info, None, filename, self.view, self.scene_graph)
+            self.view.scene().addItem(text)
+            self.scene_graph.add(text)
+            self.dormant_texts.add(text)
+            texts.append(text)
+        return texts
+
+    def open_dormant_texts(self, texts):
+        # the nvim part of materializing: open the files of these texts,
+        # without changing the current tab, and return their buffers
+        keep_current_tab = len(self.buf_num_to_tab) != 0
+        buffers = self._batched_open([t.filename for t in texts], keep_current_tab)
+        self._attach_buffers([buffer.number for buffer in buffers])
+        return buffers
+
+    def bind_opened_texts(self, texts, buffers):
+        # the Qt part of materializing, for the buffers from open_dormant_texts
+        for text, buffer in zip(texts, buffers):
+            text.materialize(buffer, init_folds=[], init_sign_lines=[])
+            self.dormant_texts.discard(text)
+            self._bind(text, buffer)
+            self.to_redraw.add(buffer.number)
+
+    def materialize_texts(self, texts, on_done=None):
+        # give dormant texts their nvim buffers: the files are opened in the nvim worker,
+        # and then bound to the texts in the GUI thread, and on_done(texts) is called
+        texts = [t for t in texts if t in self.dormant_texts and t not in self._texts_in_flight]
+        if not texts:
+            return
+        self._texts_in_flight.update(texts)
+
+        def on_opened(buffers):
+            self._texts_in_flight.difference_update(texts)
+            self.bind_opened_texts(texts, buffers)
+            if on_done is not None:
+                on_done(texts)
+
+        def on_error(_):
+            # (so they can be materialized again)
+            self._texts_in_flight.difference_update(texts)
+
+        self.view.nvim_worker.submit(
+            lambda: self.open_dormant_texts(texts), on_done=on_opened, on_error=on_error
+        )
+
+    def release_texts(self, texts):
+        # wipe the buffers of these texts in the nvim worker, leaving them as dormant
+        # placeholders - buffers with unsaved changes fail to be wiped, and are kept
+        if not texts:
+            return
+        self._texts_in_flight.update(texts)
+        buf_nums = [text.buffer.number for text in texts]
+
+        def job():
+            functions = []
+            for buf_num in buf_nums:
+                functions.append(["nvim_command", [f"silent! bwipeout {buf_num}"]])
+                functions.append(["nvim_buf_is_valid", [buf_num]])
+            results, errors = self.nvim.api.call_atomic(functions)
+            assert errors is None, errors
+            still_valid = results[1::2]
+            for buf_num, valid in zip(buf_nums, still_valid):
+                if not valid:
+                    self.buf_num_to_tab.pop(buf_num, None)
+            return still_valid
+
+        def on_done(still_valid):
+            self._texts_in_flight.difference_update(texts)
+            for text, buf_num, valid in zip(texts, buf_nums, still_valid):
+                if valid:
+                    continue
+                self._unbind(buf_num)
+                text.release()
+                self.dormant_texts.add(text)
+
+        def on_error(_):
+            self._texts_in_flight.difference_update(texts)
+
+        self.view.nvim_worker.submit(job, on_done=on_done, on_error=on_error)
+
+    def _get_view_rect(self, margin_multiplier=1):
+        view_rect = self.view.sceneRect()
+        margin = view_rect.width() * Config.lazy_margin * margin_multiplier
+        return view_rect.adjusted(-margin, -margin, margin, margin)
+
+    def get_texts_to_materialize(self):
+        in_view = self.spatial_index.query(self._get_view_rect().getCoords())
+        return [
+            text
+            for text in in_view
+            if text in self.dormant_texts and text not in self._texts_in_flight
+        ]
+
+    def _update_materialization(self, current_buf):
+        # materialize the dormant texts which entered the view
+        # and release the ones which are far away from it
+        to_materialize = self.get_texts_to_materialize()
+        # keep some hysteresis, so that texts on the edge don't flicker
+        near_view = self.spatial_index.query(self._get_view_rect(margin_multiplier=2).getCoords())
+        # texts reachable through jumps or being completed need to keep their buffers
+        pinned = {current_buf.number, *self.jumplist, *self.forward_jumplist}
+        pinned |= self.view.llm_engine.get_running_buf_nums()
+        to_release = [
+            text
+            for buf_num, text in self.buf_num_to_text.items()
+            if buf_num not in pinned
+            and text.filename is not None
+            and text not in near_view
+            and text not in self._texts_in_flight
+        ]
 
-    def create_text(self, savedir, box_info, filetype="md"):
-        num_of_texts = len(self.buf_num_to_text)
-        if num_of_texts == len(self.nvim.buffers) or num_of_texts == 0:
+        self.release_texts(to_release)
+        # the texts which entered the view need one more redraw to draw their contents
+        self.materialize_texts(to_materialize, on_done=lambda _: self.update_all_texts())
+
+    def open_new_buffer(self, savedir, filetype="md"):
+        # the nvim part of create_text: returns the filename of the new text
+        # and its buffer and buffer info, for add_text
+        buffers = self.nvim.buffers
+        bound = set(self.buf_num_to_tab)
+        if len(bound) == len(buffers) or len(bound) == 0:
             self.last_file_nums[savedir] += 1
             filename = f"{savedir}/{self.last_file_nums[savedir]}.{filetype}"
-            return self.open_filename(box_info, filename)
+            return filename, *self.open_buffer(filename=filename)
 
         # some buffer was created some other way than calling create_text,
         # so mark it to not be saved
         filename = None
 
         # get the unused buffer
-        for buf in self.nvim.buffers:
-            if buf.number not in self.buf_num_to_text:
-                return self.open_filename(box_info, filename, buf)
+        for buf in buffers:
+            if buf.number not in bound:
+                return filename, *self.open_buffer(buffer=buf)
         raise RuntimeError("no unused buffer found")
 
+    def create_text(self, savedir, box_info, filetype="md", on_created=None):
+        # the buffer is opened in the nvim worker, and then the text is created
+        # in the GUI thread, and drawn - after that on_created(text) is called
+        def on_done(opened):
+            text = self.add_text(box_info, *opened)
+            self.update_all_texts(None if on_created is None else lambda: on_created(text))
+
+        def job():
+            return self.open_new_buffer(savedir, filetype)
+
+        self.view.nvim_worker.submit(job, on_done=on_done)
+
     def jump_to_buffer(self, buf_num):
         # jumping with ":buf <num>" would make some buffers hidden and break leap
         # so we need to jump to the right tab instead
-        self.nvim.command(f"call GoToTabWithBuffer({buf_num})")
+        if buf_num not in self.buf_num_to_tab:
+            # not a text's buffer, so keep the focus on the current tab
+            return
+        # the cached tab could be closed or show another buffer by now (f.e. after
+        # a :tabclose or a :buffer in it), and then the tabs are searched
+        tab = self.buf_num_to_tab[buf_num]
+        found_handle = self.nvim.exec_lua(_jump_to_buffer_tab_lua, buf_num, tab)
+        if tab is not None and found_handle == tab.handle:
+            return
+        # replace the stale tab (None if no tab shows the buffer, so it's searched again)
+        found = None
+        if found_handle is not None:
+            found = next(t for t in self.nvim.tabpages if t.handle == found_handle)
+        self.buf_num_to_tab[buf_num] = found
 
     def jump_to_file(self, filename):
-        # jumping straight to the file would make some buffers hidden and break leap
-        # so we need to jump to the right tab instead
-        tab_num = None
-        for tab in self.nvim.api.list_tabpages():
-            wins = self.nvim.api.tabpage_list_wins(tab)
-            assert len(wins) == 1, "each tab must have exactly one window"
-            candidate_buf_num = self.nvim.api.win_get_buf(wins[0]).number
-            candidate_filename = self.nvim.api.buf_get_name(candidate_buf_num)
-            candidate_filename = Path(candidate_filename).relative_to(Path.cwd()).as_posix()
-            if candidate_filename == filename:
-                # found it
-                tab_num = tab.number
-                break
-        assert tab_num is not None, "file not found"
-        self.nvim.command(f"tabnext {tab_num}")
+        # filename is relative to the workspace
+        assert filename in self.filename_to_buf_num, "file not found"
+        self.jump_to_buffer(self.filename_to_buf_num[filename])
 
     def delete_buf(self, buf):
         text = self.buf_num_to_text.get(buf.number)
         # don't allow deleting if it has children
-        children = self.parents.inverted().getlist(text)
-        if children:
+        if self.scene_graph.get_children(text):
             self.view.msg("can't delete a text with children")
             return
         if len(self.buf_num_to_text) == 1:
             self.view.msg("can't delete the only text")
             return
 
+        if self.view.llm_engine.is_running(buf.number):
+            self.view.msg("can't delete a text while a completion is writing into it")
+            return
+
         if text.filename is not None:
-            # delete the file
-            self.nvim.command(f"call delete('{text.filename}')")
+            self.deleted_filenames.append(text.get_rel_filename())
+            if self.journal is not None:
+                self.journal.record(text.get_rel_filename(), None)
 
-        self.nvim.command(f"bwipeout! {buf.number}")
+        # the text is removed right away, and its buffer wiped in the nvim worker
+        parent = self.scene_graph.get_parent(text)
         self.view.scene().removeItem(text)
-        self.buf_num_to_text.pop(buf.number)
+        self.scene_graph.remove(text)
+        self.spatial_index.remove(text)
+        self._unbind(buf.number)
+        if parent is not None:
+            # its later siblings move up
+            parent.reposition()
 
         # delete from jumplists
         self.jumplist = [x for x in self.jumplist if x != buf.number]
         self.forward_jumplist = [x for x in self.forward_jumplist if x != buf.number]
+        jump_target = self.jumplist[-1]
+
+        def job():
+            if text.filename is not None:
+                # delete the file
+                self.nvim.command(f"call delete('{text.filename}')")
+            self.nvim.command(f"bwipeout! {buf.number}")
+            self.buf_num_to_tab.pop(buf.number, None)
+            # go where the jumplist now points to, and not where nvim went after the wipe
+            self.jump_to_buffer(jump_target)
+
+        self.view.nvim_worker.submit(job)
+        self.update_all_texts()
+
+    def record_change(self, text):
+        # log the changed box info, so it survives a crash
+        if self.journal is not None and text.filename is not None:
+            self.journal.record(text.get_rel_filename(), text.get_info())
+
+    def write_modified_buffers(self):
+        # save the texts which have unsaved changes, in one batched call
+        to_write = [
+            [buf_num, Path(text.filename).resolve().as_posix()]
+            for buf_num, text in self.buf_num_to_text.items()
+            if text.filename is not None
+        ]
+        mismatched = self.nvim.exec_lua(_write_modified_buffers_lua, to_write)
+        assert not mismatched, f"buffer names don't match their texts: {mismatched}"
 
-        del text
+    def redraw_text(self, buf_num, lines):
+        # redraw only this one text, f.e. when a completion wrote into it
+        text = self.buf_num_to_text.get(buf_num)
+        if text is None or not text.is_materialized():
+            return
+        if buf_num == self.jumplist[-1]:
+            # the current text also needs the cursor and the editor, so do a normal redraw
+            self.update_all_texts()
+            return
+        text.insides_renderer.update_text(lines, [])
+        text.insides_renderer.highlight_special_lines(lines)
+        # its height could change, so the siblings may need to move
+        self.reposition_texts([text])
+
+    def reposition_texts(self, texts):
+        # lay out the boxes which depend on the heights of these texts: a text's height
+        # only moves its later siblings, with their subtrees, so it's enough to reposition
+        # its parent (or the text itself, if it's a root), which skips the unchanged
+        # subtrees (see DraggableText._needs_layout) - so the other trees aren't walked
+        to_reposition = set()
+        for text in texts:
+            parent = self.scene_graph.get_parent(text)
+            to_reposition.add(text if parent is None else parent)
+        cull_rect = self.view.get_cull_rect()
+        # the outer ones first, so the inner ones are placed after their ancestors moved
+        for text in sorted(to_reposition, key=self.scene_graph.get_depth):
+            text.reposition(cull_rect)
+
+    def reposition_all(self):
+        # (only needed after loading - later the changed parts are repositioned)
+        cull_rect = self.view.get_cull_rect()
+        for text in self.get_root_texts():
+            text.reposition(cull_rect)
+
+    def remeasure_later(self, text):
+        # called during painting, where the geometry can't change, so the stale texts
+        # from the whole paint are collected, and each of their trees is laid out once
+        self._texts_to_remeasure.add(text)
+        self._schedule_deferred_pass()
+
+    def render_thumbnail_later(self, text):
+        # called during painting too, which shouldn't render other widgets
+        self._texts_to_thumbnail.add(text)
+        self._schedule_deferred_pass()
+
+    def _schedule_deferred_pass(self):
+        if not self._deferred_pass_scheduled:
+            self._deferred_pass_scheduled = True
+            QTimer.singleShot(0, self._run_deferred_pass)
+
+    def _run_deferred_pass(self):
+        self._deferred_pass_scheduled = False
+        # (the texts could be deleted since)
+        texts = [text for text in self._texts_to_remeasure if text in self.scene_graph]
+        self._texts_to_remeasure.clear()
+        self.reposition_texts(texts)
+
+        # after the layout, which can change the box sizes
+        texts = [text for text in self._texts_to_thumbnail if text in self.scene_graph]
+        self._texts_to_thumbnail.clear()
+        for text in texts:
+            text.render_thumbnail()
 
     def get_texts(self):
         yield from self.buf_num_to_text.values()
+        yield from self.dormant_texts
 
     def get_root_texts(self):
-        roots = set()
-        for text in self.get_texts():
-            while self.parents.get(text) is not None:
-                text = self.parents[text]
-            roots.add(text)
-        return roots
+        return self.scene_graph.get_roots()
 
     def get_current_text(self):
-        return self.buf_num_to_text.get(self.nvim.current.buffer.number)
+        # (as of the last redraw - nvim may already be further)
+        return self.buf_num_to_text.get(self.jumplist[-1])
 
     def create_child(self, filetype="md"):
-        current_text = self.buf_num_to_text.get(self.nvim.current.buffer.number)
+        current_text = self.get_current_text()
 
         if current_text.filename is None:
             # it's not a persistent buffer, so it shouldn't have children
             self.view.msg("can't create children for non-persistent buffers")
             return
 
-        child = self.create_text(
+        def on_created(child):
+            self.scene_graph.set_parent(child, current_text)
+
+            current_text.reposition()
+
+            if Config.track_jumps_on_neighbor_moves:
+                self.view.track_jump(current_text, child)
+
+            self.view.zoom_on_text(child)
+
+        self.create_text(
             self.view.current_folder,
             BoxInfo(parent_filename=current_text.get_rel_filename()),
             filetype=filetype,
+            on_created=on_created,
         )
-        self.parents[child] = current_text
 
-        current_text.reposition()
-
-        if Config.track_jumps_on_neighbor_moves:
-            self.view.track_jump(current_text, child)
-
-        self.view.zoom_on_text(child)
+    # the jumplists are only changed in the GUI thread, so after a jump in nvim,
+    # they are updated once it's done (unless a redraw changed them meanwhile,
+    # then it's recorded as a normal jump, see apply_redraw)
 
     def jump_back(self):
         if len(self.jumplist) <= 2:
             return
-        old = self.jumplist.pop()
-        self.forward_jumplist.append(old)
-        self.jump_to_buffer(self.jumplist[-1])
-        self.to_redraw.add(old)
+        new, old = self.jumplist[-2:]
+
+        def on_jumped(_):
+            if self.jumplist[-2:] == [new, old]:
+                self.jumplist.pop()
+                self.forward_jumplist.append(old)
+                self.to_redraw.add(old)
+            self.view.zoom_on_text(self.get_current_text())
+
+        self._submit_jump(new, on_jumped)
 
     def jump_forward(self):
         if len(self.forward_jumplist) == 0:
             return
-        old = self.get_current_text().buffer.number
-        self.to_redraw.add(old)
-        new = self.forward_jumplist.pop()
-        self.jumplist.append(new)
-        self.jump_to_buffer(new)
+        new = self.forward_jumplist[-1]
+
+        def on_jumped(_):
+            if self.forward_jumplist[-1:] == [new]:
+                self.to_redraw.add(self.jumplist[-1])
+                self.forward_jumplist.pop()
+                self.jumplist.append(new)
+            self.view.zoom_on_text(self.get_current_text())
+
+        self._submit_jump(new, on_jumped)
+
+    def _submit_jump(self, buf_num, on_jumped):
+        self.view.nvim_worker.submit(lambda: self.jump_to_buffer(buf_num), on_done=on_jumped)
+        self.update_all_texts()
 
     def _sanitize_buffers(self):
         current_buffer, wins = self.nvim.api.call_atomic(
@@ -184,7 +657,7 @@ class BufferHandler:
         # get the num of wins in this tab
         if len(wins) != 1:
             bufs_in_tab = {self.nvim.api.win_get_buf(win): win for win in wins}
-            unbound_bufs = [buf for buf in bufs_in_tab if buf.number not in self.buf_num_to_text]
+            unbound_bufs = [buf for buf in bufs_in_tab if buf.number not in self.buf_num_to_tab]
             for unb_buf in unbound_bufs:
                 # delete its window
                 win = bufs_in_tab[unb_buf]
@@ -192,103 +665,158 @@ class BufferHandler:
             current_buffer = self.nvim.current.buffer
 
         # if hidden buffer focused, focus on the last chosen text
-        if current_buffer.number not in self.buf_num_to_text:
-            self.jump_to_buffer(self.jumplist[-1])
+        # (a buffer just opened for a text which is not bound yet in the GUI is fine)
+        if current_buffer.number not in self.buf_num_to_tab:
+            if self._nvim_text_buf_num is not None:
+                self.jump_to_buffer(self._nvim_text_buf_num)
             current_buffer = self.nvim.current.buffer
 
         return current_buffer
 
-    def _batched_get_nvim_info(self, to_fetch: List[int]):
-        # get all relevalt data in a batched call
-        functions = [
-            ["nvim_eval", ["GetAllFolds()"]],
-            ["nvim_eval", ['getpos("v")']],
-            ["nvim_eval", ['getpos(".")']],
-            ["nvim_win_get_cursor", [0]],
-            ["nvim_eval", ["sign_getplaced()"]],
-        ]
-        for buf_num in to_fetch:
-            functions.append(["nvim_buf_get_lines", [buf_num, 0, -1, False]])
-
-        for buf_num in to_fetch:
-            _args = [buf_num, -1, (0, 0), (-1, -1), {"details": True}]
-            functions.append(["nvim_buf_get_extmarks", _args])
-
-        # later also get highlight info of bookmarks
-
-        results, errors = self.nvim.api.call_atomic(functions)
-        assert errors is None, errors
-        results = deque(results)
-
-        cur_buf_info = dict(
-            folds=results.popleft(),
-            selection_start=results.popleft(),
-            selection_end=results.popleft(),
-            cursor_position=results.popleft(),
-            bookmark_info=results.popleft(),
-        )
-
-        all_lines = dict()
-        for buf_num in to_fetch:
-            all_lines[buf_num] = results.popleft()
-
-        all_extmarks = dict()
-        for buf_num in to_fetch:
-            all_extmarks[buf_num] = results.popleft()
-
-        return cur_buf_info, all_lines, all_extmarks
-
-    def update_all_texts(self):
+    def update_all_texts(self, on_drawn=None):
+        # fetch the nvim state in the nvim worker (after the jobs submitted before),
+        # and then draw it in the GUI thread, and call on_drawn()
+        key_times = self.undrawn_key_times
+        self.undrawn_key_times = []
+
+        def on_done(state):
+            self.absorb_state(state)
+            self.apply_redraw(state)
+            tracer.drawn(KEY_TO_PAINT, key_times)
+            if on_drawn is not None:
+                on_drawn()
+
+        self.view.nvim_worker.submit(self.fetch_redraw_state, on_done=on_done)
+
+    @traced
+    def fetch_redraw_state(self):
+        # only nvim calls here and no Qt, so it can run in the nvim worker thread
+        # it only uses the nvim side state, and returns plain data, see absorb_state
         # TODO this line hangs if vim-ai is completing
         # so probably we'd neet to have our own completion
         mode_info = self.nvim.api.get_mode()
         if mode_info["blocking"]:
-            return
-
-        # unfocus the text boxes - but better would be to always have focus
-        self.view.dummy.setFocus()
-        self.to_redraw.add(self.jumplist[-1])
+            return None
 
         # (note: sanitize_buffers can change the current buffer)
         current_buf = self._sanitize_buffers()
 
-        # grow jumplist
-        if current_buf.number != self.jumplist[-1] and current_buf.number in self.buf_num_to_text:
-            self.jumplist.append(current_buf.number)
-            self.forward_jumplist = []
-            self.jumplist = self.jumplist[-30:]
-            # if we jumped, make sure we are in insert mode (in case of leap or other motions)
-            if not Config.vim_mode and mode_info["mode"] == "n":
-                self.nvim.command("startinsert")
-                mode_info = self.nvim.api.get_mode()
+        # a jump to another text (f.e. with leap) grows the jumplist, in apply_redraw
+        jumped_to = None
+        if current_buf.number in self.buf_num_to_tab:
+            if current_buf.number != self._nvim_text_buf_num:
+                jumped_to = current_buf.number
+                # if we jumped, make sure we are in insert mode (in case of leap or other motions)
+                if not Config.vim_mode and mode_info["mode"] == "n":
+                    self.nvim.command("startinsert")
+            self._nvim_text_buf_num = current_buf.number
+
+        # get all relevant data in one call to infinote_snapshot (see infinote.lua)
+        # it only sends the fields which changed since the previous snapshot,
+        # and only the changed lines - the rest is already in self.buf_lines
+        # (including the mode, which may have changed since the check above)
+        snapshot = self.nvim.exec_lua("return infinote_snapshot(...)", list(self.buf_num_to_tab))
+        return dict(current_buf=current_buf, jumped_to=jumped_to, snapshot=snapshot)
+
+    @traced
+    def absorb_state(self, state):
+        # the GUI part of fetching: merge a fetched snapshot into the GUI state, and
+        # complete the state with it - every fetched state must go through here, in the
+        # order they were fetched, even if it's never drawn, because the snapshots
+        # only carry what changed since the previous one
+        if state is None:
+            return
+        snapshot = dict(state.pop("snapshot"))
+        changes = snapshot.pop("changes")
+        extmarks = snapshot.pop("extmarks")
+        self._snapshot.update(snapshot)
+        self._state_num += 1
+
+        # the snapshot already cleared these changes in nvim, so they must be drawn
+        # with some redraw, even if this state isn't drawn
+        self.to_redraw |= self._apply_changes(changes)
+
+        state.update(
+            state_num=self._state_num,
+            mode_info=self._snapshot["mode"],
+            cur_buf_info=dict(
+                folds=self._snapshot["folds"],
+                selection_start=self._snapshot["selection_start"],
+                selection_end=self._snapshot["selection_end"],
+                cursor_position=self._snapshot["cursor_position"],
+                sign_lines=self._snapshot["sign_lines"],
+                # not really about the current buffer, but it's convenient to fetch it here
+                num_buffers=self._snapshot["num_buffers"],
+            ),
+            # (a shallow copy, the line lists themselves are never modified)
+            all_lines=dict(self.buf_lines),
+            all_extmarks={int(buf_num): marks for buf_num, marks in extmarks.items()},
+        )
 
-        self._redraw(mode_info, current_buf)
+    @traced
+    def apply_redraw(self, state):
+        # only Qt calls here, so it must run in the GUI thread
+        # (for a state which went through absorb_state)
+        if state is None:
+            return
+        if state["state_num"] < self._applied_state_num:
+            # a newer state was already drawn
+            return
+        self._applied_state_num = state["state_num"]
+        self.num_buffers = state["cur_buf_info"]["num_buffers"]
+        self.mode_info = state["mode_info"]
+        if state["current_buf"].number not in self.buf_num_to_text:
+            # the texts changed since this state was fetched, a newer one will come
+            return
+
+        # the previous current text needs a redraw too, to lose its cursor
+        self.to_redraw.add(self.jumplist[-1])
+        jumped_to = state["jumped_to"]
+        # (the jump could already be recorded, f.e. by jump_back)
+        if jumped_to is not None and jumped_to != self.jumplist[-1]:
+            self.jumplist = (self.jumplist + [jumped_to])[-30:]
+            self.forward_jumplist = []
 
-    def _redraw(self, mode_info, current_buf):
-        # choose which ones to redraw
+        # unfocus the text boxes - but better would be to always have focus
+        self.view.dummy.setFocus()
+        self._redraw(state)
+
+        if Config.lazy_materialization:
+            # open the texts which entered the view, and release the far away ones
+            self._update_materialization(state["current_buf"])
+
+    def _redraw(self, state):
+        mode_info = state["mode_info"]
+        current_buf = state["current_buf"]
+        cur_buf_info = state["cur_buf_info"]
+        all_lines = state["all_lines"]
+        all_extmarks = state["all_extmarks"]
+
+        # choose which ones to redraw: only the changed ones
+        # and the ones which gained or lost focus
+        # (texts may have been deleted or released since the state was fetched)
+        # extmark labels are drawn in overlays, so they don't need a redraw
         self.to_redraw.add(current_buf.number)
-        all_bufs = self.buf_num_to_text.keys()
-        to_redraw = self.to_redraw & set(all_bufs)
+        to_redraw = self.to_redraw & set(self.buf_num_to_text) & set(all_lines)
         self.to_redraw = set()
 
-        # get batched info from nvim about potentially changed buffers
-        cur_buf_info, all_lines, all_extmarks = self._batched_get_nvim_info(all_bufs)
-        for buf_num, extmarks in all_extmarks.items():
-            if extmarks != []:
-                to_redraw.add(buf_num)
+        # the renderer modifies the lines it gets, so give it copies
+        all_lines = {buf_num: list(all_lines[buf_num]) for buf_num in to_redraw}
 
         ####################################################
         # actual redraw
 
+        # folds and signs decide which lines are shown, so set them before rendering
+        current_text = self.buf_num_to_text[current_buf.number]
+        current_text.insides_renderer.set_buf_info(cur_buf_info)
+
         # initial redraw
         for buf_num in to_redraw:
             text = self.buf_num_to_text[buf_num]
             lines = all_lines[buf_num]
-            extmarks = all_extmarks[buf_num]
-            text.insides_renderer.update_text(lines, extmarks)
+            text.insides_renderer.update_text(lines, [])
 
         # draw the things that the current buffer has
-        current_text = self.buf_num_to_text[current_buf.number]
         lines = all_lines[current_buf.number]
         current_text.insides_renderer.update_current_text(mode_info, cur_buf_info, lines)
 
@@ -307,34 +835,29 @@ class BufferHandler:
             # but only one widget can have focus
             current_text.insides_renderer.draw_cursor(mode_info, cur_buf_info)
 
-        # set (invisible) cursor, hide folds
-        for buf_num in to_redraw:
-            text = self.buf_num_to_text[buf_num]
-            # # hide folds deletes lines so it needs to be at the end
-            # text.insides_renderer.set_invisible_cursor_pos()
-            # text.insides_renderer.hide_folds() # todo maybe add it back later
-            text.insides_renderer.hide_unimportant_lines()
+        # draw the labels over the texts which have them now, or had them before
+        to_label = (self.labelled_buf_nums | set(all_extmarks)) & set(self.buf_num_to_text)
+        self.labelled_buf_nums = set()
+        for buf_num in to_label:
+            extmarks = all_extmarks.get(buf_num, [])
+            self.buf_num_to_text[buf_num].update_labels(extmarks, buf_num in to_redraw)
+            if extmarks:
+                self.labelled_buf_nums.add(buf_num)
 
-        # reposition all text boxes
-        for text in self.get_root_texts():
-            text.reposition()
+        # reposition the boxes around the redrawn texts, whose heights could change
+        self.reposition_texts([self.buf_num_to_text[buf_num] for buf_num in to_redraw])
 
         # draw the editor
         if self.view.show_editor:
             buf_num = current_buf.number
             lines = all_lines[buf_num]
-            extmarks = all_extmarks[buf_num]
+            extmarks = all_extmarks.get(buf_num, [])
             editor_box = self.view.editor_box
+            editor_box.insides_renderer.set_buf_info(cur_buf_info)
             editor_box.insides_renderer.update_text(lines, extmarks)
             editor_box.insides_renderer.update_current_text(mode_info, cur_buf_info, lines)
             editor_box.insides_renderer.highlight_special_lines(lines)
             editor_box.insides_renderer.draw_cursor(mode_info, cur_buf_info)
             editor_box.insides_renderer.set_invisible_cursor_pos()
-            # editor_box.insides_renderer.hide_folds() # todo maybe add it back later
 
         ####################################################
-
-        # mark texts with extmarks to be redrawn on next call
-        for buf_num, extmarks in all_extmarks.items():
-            if extmarks != []:
-                self.to_redraw.add(buf_num)
@@ -88,6 +88,8 @@ class Config:
             f"<{mod}-f>": "focus on current text",
             # Summon GPT through vim-ai plugin
             f"<{mod}-s>": "summon gpt",
+            # Query the LLM in an .aichat text (press again to cancel)
+            f"<{mod}-q>": "complete chat",
             # delete text
             "<C-w>": "delete text",
             # Detach child
@@ -98,6 +100,9 @@ class Config:
             "<A-Left>": "jump back",
             "<A-Right>": "jump forward",
 
+            # show latency percentiles, when Config.tracing is on
+            f"<{mod}-1>": "toggle debug overlay",
+
             # # toggle editor View
             # f"<{mod}-v>": "toggle editor",
             # # zoom in, pushing the current box to the Right
@@ -107,6 +112,58 @@ class Config:
 
     # relevant for zooming and resizing with keys
     FPS = 180
+    # at most this many redraws per second after key presses - keys typed in between
+    # are sent to nvim together, and only the newest state is drawn
+    redraw_fps = 60
+    # but don't postpone drawing the typed keys for longer than this many seconds
+    redraw_latency_budget = 0.1
+
+    # how many files to open in one batched nvim call when loading the workspace
+    load_batch_size = 200
+    # if True, only the texts near the view get nvim buffers and widgets,
+    # the rest are drawn as placeholders (note: leap can then only hop to those loaded)
+    lazy_materialization = False
+    # how far outside the view texts get loaded, as a fraction of the view width
+    lazy_margin = 0.5
+    # how far outside the view texts are still repositioned when zooming and redrawing,
+    # as a fraction of the view width (the farther ones are hidden until they come into view)
+    cull_margin = 0.2
+    # how text boxes are drawn: "widget" embeds a QTextEdit in each box,
+    # "painter" draws the box's document directly, which is much lighter for big workspaces
+    box_backend = "widget"
+    # texts smaller than this many pixels on screen are drawn as a cached thumbnail,
+    # and smaller than lod_block_height as a block in their group's color
+    lod_thumbnail_height = 60
+    lod_block_height = 8
+    # completions in .aichat texts, from any OpenAI-compatible chat completions endpoint
+    # (point llm_api_url to a local server to use a local model)
+    llm_api_url = "https://api.openai.com/v1/chat/completions"
+    llm_model = "gpt-4o"
+    # file with the API key, not needed for local servers
+    llm_token_path = "~/.config/openai.token"
+    # how often the streamed tokens are written into the buffer, in seconds
+    llm_flush_interval = 0.1
+    llm_timeout = 60
+
+    # box info changes are appended to a journal in the background, in batches
+    # of at most this many records, waiting at most this many seconds to fill a batch
+    journal_batch_size = 100
+    journal_flush_interval = 0.5
+
+    # if True, every nvim call is timed and measured, per method and call site
+    # the calls since the last redraw are summed up in the status bar,
+    # and all the stats are written to rpc_stats_path at exit
+    rpc_stats = False
+    rpc_stats_path = "~/.cache/infinote/rpc_stats.txt"
+    # if True, the timings of the main stages of handling keys, redrawing and painting
+    # are kept in a ring buffer of this many spans, and written to trace_path at exit,
+    # as a Chrome trace (open it in chrome://tracing or ui.perfetto.dev)
+    # the latencies from key presses and zooms to the paints which show them are kept too,
+    # and their percentiles can be shown with "toggle debug overlay"
+    tracing = False
+    trace_buffer_size = 100_000
+    trace_latency_samples = 1000
+    trace_path = "~/.cache/infinote/trace.json"
 
     input_on_creation = "- "
     input_on_creation_aichat = """\
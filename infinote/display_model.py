@@ -0,0 +1,71 @@
+import re
+
+from infinote.config import Config
+
+FOLD_MARKER = " ..."
+
+
+class DisplayModel:
+    # decides which buffer lines are shown and how, before anything is rendered
+    #
+    # the rendered document keeps one block per buffer line (hidden ones are just
+    # invisible), so line numbers are the same in the buffer and in the document,
+    # and this model translates between real lines and the rows that are shown
+    #
+    # all line numbers here are 0-based
+
+    def __init__(self, lines, folds=(), sign_lines=(), outline=False):
+        # folds are [start, end] pairs of closed folds, 1-based and inclusive
+        # sign_lines are 1-based too (both come from infinote_snapshot, see infinote.lua)
+        # outline hides unimportant lines and marks expandable ones with "+"
+        self.displayed_lines = list(lines)
+        self.visible = [True] * len(lines)
+
+        if outline:
+            for i, line in enumerate(lines):
+                self.visible[i] = (
+                    # keep lines with a non-space character at the beginning
+                    bool(re.match(r"^\S", line))
+                    # keep empty lines
+                    or line.strip() == ""
+                    # keep lines with "- !" or "- ?" or "!" or "?" at the beginning
+                    or bool(Config.highlight_lines_regex.match(line))
+                    # keep bookmarked lines
+                    or i + 1 in sign_lines
+                )
+            # draw + signs on lines starting with "-" and having indented sublines
+            for i, line in enumerate(lines[:-1]):
+                if re.match(r"^-", line) and re.match(r"^\s+\S", lines[i + 1]):
+                    self.displayed_lines[i] = "+" + line[1:]
+
+        for start, end in folds:
+            head = start - 1
+            if head >= len(lines):
+                continue
+            self.displayed_lines[head] += FOLD_MARKER
+            for i in range(start, min(end, len(lines))):
+                self.visible[i] = False
+
+        # rows of the shown lines, and for each line the row which represents it
+        # (a hidden line is represented by the closest shown line above it)
+        # (hidden lines before the first shown one are represented by it)
+        self.shown = [i for i, visible in enumerate(self.visible) if visible]
+        self._line_to_row = []
+        row = -1
+        for visible in self.visible:
+            if visible:
+                row += 1
+            self._line_to_row.append(max(row, 0))
+
+    def to_row(self, line_num):
+        # the row of the displayed text at which this line is (or would be) shown
+        return self._line_to_row[line_num]
+
+    def to_line(self, row):
+        return self.shown[row]
+
+    def representative(self, line_num):
+        # the shown line which stands for this line, f.e. the head of a fold it's in
+        if not self.shown or line_num >= len(self.visible):
+            return line_num
+        return self.shown[self.to_row(line_num)]
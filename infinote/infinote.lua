@@ -0,0 +1,132 @@
+-- nvim state fetched by infinote on each redraw, loaded by required.vim
+-- everything a redraw needs comes from one infinote_snapshot call
+
+
+-- line change tracking
+-- buffers bound to texts are attached with nvim_buf_attach, and their line changes
+-- are merged into one changed range per buffer: the lines [first, old_end) of what we
+-- last fetched are now the lines [first, new_end) - so only those need to be fetched
+
+local changes = {}
+
+local function record_change(buf, first, old_last, new_last)
+    local change = changes[buf]
+    if change == nil then
+        changes[buf] = {first, old_last, new_last}
+        return
+    end
+    local start, old_end, new_end = change[1], change[2], change[3]
+    -- lines after the changed range are shifted by (new_end - old_end)
+    change[2] = old_end + math.max(0, old_last - new_end)
+    change[3] = math.max(new_end, old_last) + new_last - old_last
+    change[1] = math.min(start, first)
+end
+
+function _G.infinote_attach(bufs)
+    for _, buf in ipairs(bufs) do
+        -- the first fetch gets the whole buffer
+        changes[buf] = {0, 0, vim.api.nvim_buf_line_count(buf)}
+        vim.api.nvim_buf_attach(buf, false, {
+            on_lines = function(_, b, _, first, old_last, new_last)
+                record_change(b, first, old_last, new_last)
+            end,
+            on_reload = function(_, b)
+                changes[b] = {0, 2147483647, vim.api.nvim_buf_line_count(b)}
+            end,
+            on_detach = function(_, b)
+                changes[b] = nil
+            end,
+        })
+    end
+end
+
+-- returns {buf = {first, old_end, changed_lines}} and clears the changes
+local function pop_changes()
+    -- (empty_dict, so that even with no changes a dict is sent, not a list)
+    local popped = vim.empty_dict()
+    for buf, change in pairs(changes) do
+        if vim.api.nvim_buf_is_valid(buf) then
+            local lines = vim.api.nvim_buf_get_lines(buf, change[1], change[3], false)
+            popped[tostring(buf)] = {change[1], change[2], lines}
+        end
+    end
+    changes = {}
+    return popped
+end
+
+-- the extmarks of the buffers which have any (f.e. leap labels)
+local function get_extmarks(bufs)
+    local extmarks = vim.empty_dict()
+    for _, buf in ipairs(bufs) do
+        if vim.api.nvim_buf_is_valid(buf) then
+            local marks = vim.api.nvim_buf_get_extmarks(buf, -1, 0, -1, {details = true})
+            if #marks > 0 then
+                extmarks[tostring(buf)] = marks
+            end
+        end
+    end
+    return extmarks
+end
+
+
+-- folds and signs of the current window
+
+-- [start, end] pairs of the closed folds, 1-based and inclusive
+local function get_closed_folds()
+    local folds = {}
+    local lineno = 1
+    local endline = vim.fn.line("$")
+    while lineno <= endline do
+        local start = vim.fn.foldclosed(lineno)
+        if start ~= -1 then
+            local stop = vim.fn.foldclosedend(lineno)
+            table.insert(folds, {start, stop})
+            lineno = stop + 1
+        else
+            lineno = lineno + 1
+        end
+    end
+    return folds
+end
+
+-- 1-based numbers of the lines with signs placed in the current buffer
+local function get_sign_lines()
+    local sign_lines = {}
+    local placed = vim.fn.sign_getplaced(vim.api.nvim_get_current_buf())
+    if placed[1] ~= nil then
+        for _, sign in ipairs(placed[1].signs) do
+            table.insert(sign_lines, sign.lnum)
+        end
+    end
+    return sign_lines
+end
+
+function _G.infinote_buf_info()
+    return {folds = get_closed_folds(), sign_lines = get_sign_lines()}
+end
+
+
+-- the fields sent in the previous snapshot
+local last = {}
+
+-- returns the fields which changed since the previous snapshot,
+-- plus the line changes and the extmarks of the given buffers
+function _G.infinote_snapshot(bufs)
+    local fields = {
+        mode = vim.api.nvim_get_mode(),
+        cursor_position = vim.api.nvim_win_get_cursor(0),
+        selection_start = vim.fn.getpos("v"),
+        selection_end = vim.fn.getpos("."),
+        folds = get_closed_folds(),
+        sign_lines = get_sign_lines(),
+        num_buffers = #vim.api.nvim_list_bufs(),
+    }
+    local snapshot = {changes = pop_changes(), extmarks = get_extmarks(bufs)}
+    for name, value in pairs(fields) do
+        if not vim.deep_equal(value, last[name]) then
+            snapshot[name] = value
+        end
+    end
+    last = fields
+    return snapshot
+end
@@ -0,0 +1,96 @@
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+
+from infinote.config import Config
+
+# append-only log of box info changes, so that a crash doesn't lose the layout work
+# of the whole session - it is replayed on the next load and then compacted into the index
+JOURNAL_FILENAME = "journal.jsonl"
+
+_stop = object()
+
+
+class Journal:
+    def __init__(self, journal_path: Path):
+        self.journal_path = journal_path
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def record(self, rel_filename: str, info: dict | None):
+        # called on the GUI thread, so it only enqueues - writing happens in the background
+        # info=None means that the box was deleted
+        self._queue.put((rel_filename, info))
+
+    def close(self):
+        # write everything still pending and stop the writer thread
+        self._queue.put(_stop)
+        self._thread.join()
+
+    def _write_loop(self):
+        with open(self.journal_path, "a") as f:
+            if not _ends_with_newline(self.journal_path):
+                # the last record was cut by a crash, the next ones mustn't be glued to it
+                f.write("\n")
+            stopping = False
+            while not stopping:
+                # wait for the first record, then give the rest of the batch a moment to arrive
+                batch = [self._queue.get()]
+                stopping = batch[0] is _stop
+                if not stopping:
+                    stopping = _stop in self._drain(batch)
+
+                # when dragging, the same box is recorded many times, so keep only the last
+                latest = {}
+                for item in batch:
+                    if item is _stop:
+                        continue
+                    rel_filename, info = item
+                    latest[rel_filename] = info
+
+                for rel_filename, info in latest.items():
+                    f.write(json.dumps([rel_filename, info]) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _drain(self, batch):
+        try:
+            while len(batch) < Config.journal_batch_size:
+                batch.append(self._queue.get(timeout=Config.journal_flush_interval))
+                if batch[-1] is _stop:
+                    break
+        except queue.Empty:
+            pass
+        return batch
+
+
+def _ends_with_newline(path: Path) -> bool:
+    # (an empty file counts as ending with one)
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def read_journal(journal_path: Path) -> dict[str, dict | None]:
+    # returns the latest recorded info for each box (None for deleted ones)
+    if not journal_path.exists():
+        return {}
+    records = {}
+    for line in journal_path.read_text().splitlines():
+        try:
+            rel_filename, info = json.loads(line)
+        except ValueError:
+            # the last line may be cut if we crashed while writing it
+            continue
+        records[rel_filename] = info
+    return records
+
+
+def clear_journal(journal_path: Path):
+    # only call it after the records were compacted into the index
+    journal_path.unlink(missing_ok=True)
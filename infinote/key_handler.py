@@ -1,6 +1,7 @@
 from PySide6.QtCore import Qt, QTimer
 
 from infinote.config import Config
+from infinote.tracing import traced
 
 
 _cmd_normalizer = {"<S-:>": ":", ":": ":", "/": "/", "<S-?>": "?", "?": "?", "<S-/>": "?"}
@@ -61,6 +62,11 @@ def _handle_non_vim_visual_mode(nvim, text):
             nvim.input("c" + text)
     if nvim.api.get_mode()["mode"] == "n":
         nvim.input("i")
+
+
+def _leave_insert_mode(nvim):
+    if nvim.api.get_mode()["mode"] == "i":
+        nvim.input("<Esc>")
     
 
 
@@ -72,17 +78,33 @@ class KeyHandler:
         self.command = ""
         self.external_command_mode = False
 
-    def handle_key_event(self, event):
-        text = parse_key_event_into_text(event)
-        if text is None:
-            return
-
+    @traced
+    def handle_keys(self, keys):
+        # handles a burst of (text, raw_text) non-custom keys
+        # while in insert mode, typed chars are just sent, so they go in one nvim_input call
+        # any key notation, like <CR> or <C-w>, could be mapped to anything, f.e. to leave
+        # insert mode, so it ends the batch, and the mode is checked again after it
         mode = self.nvim.api.get_mode()["mode"]
-        if text in Config.keys:
-            # custom command pressed
-            self.handle_custom_command(text, mode)
-            return
-        
+        to_send = ""
+        for text, raw_text in keys:
+            if mode == "i" and len(text) == 1 and text.isprintable():
+                # (escape "<" so that typed text is not interpreted as key notation)
+                to_send += "<lt>" if text == "<" else text
+                continue
+            if to_send:
+                self.nvim.input(to_send)
+                to_send = ""
+            self.handle_key(text, raw_text)
+            mode = self.nvim.api.get_mode()["mode"]
+        if to_send:
+            self.nvim.input(to_send)
+
+    def handle_key(self, text, raw_text, mode=None):
+        # handles non-custom keys - it only talks to nvim, without touching Qt,
+        # so it can run in the nvim worker thread
+        if mode is None:
+            mode = self.nvim.api.get_mode()["mode"]
+
         if text in ["<C-o>", "<C-i>"]:
             # ignore because otherwise they produce unwanted buffers
             return
@@ -104,7 +126,7 @@ class KeyHandler:
         # monitor command and search input
         if self.command or self.external_command_mode:
             # eat the keypress into self.command
-            self._absorb_key_into_command_line(text, event.text())
+            self._absorb_key_into_command_line(text, raw_text)
             return
         assert self.command == ""
         if text in _cmd_normalizer:
@@ -127,28 +149,45 @@ class KeyHandler:
             view.timer.timeout.connect(function)
             view.timer.start(1000 / Config.FPS)
 
-    def handle_custom_command(self, key_combo, mode):
+    def _run_in_nvim(self, job, on_drawn=None):
+        # job runs in the nvim worker, and then the new nvim state is drawn
+        self.view.nvim_worker.submit(job)
+        self.view.buf_handler.update_all_texts(on_drawn)
+
+    @traced
+    def handle_custom_command(self, key_combo):
+        # runs in the GUI thread, so the commands which need nvim submit their nvim calls
+        # to the nvim worker (after the keys pressed before them)
         if key_combo not in Config.keys:
             return
         command = Config.keys[key_combo]
 
         buf_handler = self.view.buf_handler
         view = self.view
+        nvim = self.nvim
 
         match command:
             case "hop":
-                if mode == "i":
-                    self.nvim.input("<Esc>")
                 cmd = "lua require('leap').leap { target_windows = vim.api.nvim_list_wins() }"
-                self.nvim.input(f":{cmd}<CR>")
+
+                def hop():
+                    _leave_insert_mode(nvim)
+                    nvim.input(f":{cmd}<CR>")
+
+                self._run_in_nvim(hop)
             case "bookmark jump":
-                if mode == "i":
-                    self.nvim.input("<Esc>")
                 if buf_handler.get_current_text().filename is not None:
                     return  # we are not in the bookmarks window, bc we have a filename
                 cmd = '<Home>"fyt|f|<Right>"lyiw:buffer<Space><C-r>f<Enter>:<C-r>l<Enter>'
-                self.nvim.input(cmd)
-                view.zoom_on_text(buf_handler.get_current_text())
+
+                def bookmark_jump():
+                    _leave_insert_mode(nvim)
+                    nvim.input(cmd)
+
+                self._run_in_nvim(
+                    bookmark_jump,
+                    on_drawn=lambda: view.zoom_on_text(buf_handler.get_current_text()),
+                )
             case "focus on current text":
                 current_text = buf_handler.get_current_text()
                 view.global_scale = view.get_scale_centered_on_text(current_text)
@@ -159,6 +198,8 @@ class KeyHandler:
                 buf_handler.create_child()
             case "summon gpt":
                 buf_handler.create_child(filetype="aichat")
+            case "complete chat":
+                view.llm_engine.toggle(buf_handler.get_current_text())
             case "move down":
                 view.jump_to_neighbor("down")
             case "move up":
@@ -172,24 +213,21 @@ class KeyHandler:
             case "zoom down":
                 self._continuous_command(lambda: view.zoom(1))
             case "grow box":
-                self._continuous_command(lambda: view.resize(1))
+                self._continuous_command(lambda: view.scale_current_text(1))
             case "shrink box":
-                self._continuous_command(lambda: view.resize(-1))
+                self._continuous_command(lambda: view.scale_current_text(-1))
             case "jump back":
                 buf_handler.jump_back()
-                view.zoom_on_text(buf_handler.get_current_text())
             case "jump forward":
                 buf_handler.jump_forward()
-                view.zoom_on_text(buf_handler.get_current_text())
             case "delete text":
                 current_text = buf_handler.get_current_text()
-                current_text.parent_filename = None
-                buf_handler.parents.pop(current_text, None)
-                buf_handler.delete_buf(self.nvim.current.buffer)
+                self._detach(current_text)
+                buf_handler.delete_buf(current_text.buffer)
             case "detach child":
-                current_text = buf_handler.get_current_text()
-                current_text.parent_filename = None
-                buf_handler.parents.pop(current_text, None)
+                self._detach(buf_handler.get_current_text())
+            case "toggle debug overlay":
+                view.toggle_debug_overlay()
             # case "toggle editor":
             #     if view.show_editor:
             #         view.show_editor = False
@@ -198,6 +236,17 @@ class KeyHandler:
             #         view.show_editor = True
             #         view.editor_box.show()
 
+    def _detach(self, text):
+        scene_graph = self.view.buf_handler.scene_graph
+        parent = scene_graph.get_parent(text)
+        text.parent_filename = None
+        text.mark_dirty()
+        scene_graph.detach(text)
+        if parent is not None:
+            # its scale changes, and its later siblings move up
+            text.reposition()
+            parent.reposition()
+
     def _absorb_key_into_command_line(self, text, raw_text):
         match text:
             case "<Esc>":
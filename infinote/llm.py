@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+from PySide6.QtCore import QObject, Signal
+
+from infinote.config import Config
+
+# appends text at the end of a buffer (the last line gets extended, the rest is added)
+# and returns all the buffer lines, so that the box can be redrawn
+_append_text_lua = """
+local buf, text = ...
+local last_line = vim.api.nvim_buf_get_lines(buf, -2, -1, false)[1]
+local new_lines = vim.split(last_line .. text, "\\n", {plain = true})
+vim.api.nvim_buf_set_lines(buf, -2, -1, false, new_lines)
+return vim.api.nvim_buf_get_lines(buf, 0, -1, false)
+"""
+
+
+def parse_aichat(lines):
+    # parse the vim-ai .aichat format into chat messages
+    # sections start with ">>> system", ">>> user", "<<< assistant" or ">>> include"
+    # include sections list file globs, whose contents are sent as user messages
+    headers = {
+        ">>> system": "system",
+        ">>> user": "user",
+        "<<< assistant": "assistant",
+        ">>> include": "include",
+    }
+    sections = []
+    for line in lines:
+        if line.strip() in headers:
+            sections.append((headers[line.strip()], []))
+        elif sections:
+            sections[-1][1].append(line)
+        elif line.strip():
+            # text before the first header is treated as the user's
+            sections.append(("user", [line]))
+
+    messages = []
+    for role, section_lines in sections:
+        if role == "include":
+            content = _read_included_files(section_lines)
+            role = "user"
+        else:
+            content = "\n".join(section_lines).strip()
+        if content:
+            messages.append(dict(role=role, content=content))
+    return messages
+
+
+def _read_included_files(patterns):
+    # paths are relative to the workspace dir, which is the current dir
+    contents = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        for path in sorted(Path.cwd().glob(pattern)):
+            if path.is_file():
+                contents.append(f"==> {path.relative_to(Path.cwd())} <==\n{path.read_text()}")
+    return "\n\n".join(contents)
+
+
+def _stream_tokens(messages, cancelled):
+    # yields content pieces from an OpenAI-compatible streaming chat completions endpoint
+    headers = {"Content-Type": "application/json"}
+    token_path = Path(Config.llm_token_path).expanduser()
+    if token_path.exists():
+        headers["Authorization"] = f"Bearer {token_path.read_text().strip()}"
+    body = dict(model=Config.llm_model, messages=messages, stream=True)
+    request = urllib.request.Request(
+        Config.llm_api_url, data=json.dumps(body).encode(), headers=headers
+    )
+    with urllib.request.urlopen(request, timeout=Config.llm_timeout) as response:
+        # server sent events, one "data: {...}" line per chunk
+        for raw_line in response:
+            if cancelled.is_set():
+                return
+            line = raw_line.decode().strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:") :].strip()
+            if data == "[DONE]":
+                return
+            choices = json.loads(data).get("choices") or [{}]
+            content = choices[0].get("delta", {}).get("content")
+            if content:
+                yield content
+
+
+class LlmEngine(QObject):
+    # streams completions into .aichat buffers in background threads,
+    # possibly several at once, each into a different box
+
+    # emitted in the completion threads, but delivered in the GUI thread
+    _message = Signal(str)
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        # buf_num -> cancellation event of the completion writing into that buffer
+        self._running = {}
+        self._message.connect(self._show_message)
+
+    def is_running(self, buf_num):
+        return buf_num in self._running
+
+    def get_running_buf_nums(self):
+        return set(self._running)
+
+    def toggle(self, text):
+        # start completing the chat in this text, or cancel if it's already running
+        buf_num = text.buffer.number
+        if buf_num in self._running:
+            self._running[buf_num].set()
+            return
+        if text.filename is None or not text.filename.endswith(".aichat"):
+            self.view.msg("completion only works in .aichat texts")
+            return
+
+        cancelled = threading.Event()
+        self._running[buf_num] = cancelled
+        thread = threading.Thread(
+            target=self._complete, args=(buf_num, text.buffer, cancelled), daemon=True
+        )
+        thread.start()
+
+    def cancel_all(self):
+        for cancelled in self._running.values():
+            cancelled.set()
+
+    def _complete(self, buf_num, buffer, cancelled):
+        try:
+            # the chat is read in the nvim worker, after the keys typed before
+            lines = self.view.nvim_worker.submit(lambda: buffer[:]).result()
+            messages = parse_aichat(lines)
+            self._append(buf_num, "\n\n<<< assistant\n\n")
+            pending = ""
+            last_flush = time.time()
+            for token in _stream_tokens(messages, cancelled):
+                pending += token
+                if time.time() - last_flush > Config.llm_flush_interval:
+                    self._append(buf_num, pending)
+                    pending = ""
+                    last_flush = time.time()
+            if pending:
+                self._append(buf_num, pending)
+            self._append(buf_num, "\n\n>>> user\n\n")
+            if cancelled.is_set():
+                self._message.emit("completion cancelled")
+        except Exception as e:
+            self._message.emit(f"completion failed: {e}")
+        finally:
+            self._running.pop(buf_num, None)
+
+    def _append(self, buf_num, text):
+        # the text is appended in the nvim worker, and the box redrawn in the GUI thread
+        def job():
+            return self.view.nvim.exec_lua(_append_text_lua, buf_num, text)
+
+        def on_done(lines):
+            self.view.buf_handler.redraw_text(buf_num, lines)
+
+        self.view.nvim_worker.submit(job, on_done=on_done)
+
+    def _show_message(self, msg):
+        self.view.msg(msg)
+        self.view._render_status_bar()
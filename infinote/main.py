@@ -7,7 +7,10 @@ from pathlib import Path
 import pynvim
 from PySide6.QtWidgets import QApplication, QMainWindow
 
+from infinote.config import Config
 from infinote.persistence import load_scene, save_scene
+from infinote.rpc_stats import RpcStats
+from infinote.tracing import tracer
 from infinote.view import GraphicView
 
 parser = argparse.ArgumentParser(description="Infinote: Feel the spatial freedom in your notes")
@@ -57,9 +60,11 @@ def main():
     # text that doesn't fit in window can't be jumped to with Leap (for now)
     nvim.ui_attach(80, 100, True)
     # nvim = pynvim.attach('socket', path='/tmp/nvim')  # there's no speedup to this
+    rpc_stats = RpcStats(nvim) if Config.rpc_stats else None
 
     app = QApplication(sys.argv)
     view = GraphicView(nvim, group_dir)
+    view.rpc_stats = rpc_stats
     buf_handler = view.buf_handler
     w = MainWindow(view)  # NOSONAR
 
@@ -69,14 +74,23 @@ def main():
     assert len(nvim.buffers) == 1, "we require nvim to start with one buffer"
 
     load_scene(buf_handler, group_dir)
+    buf_handler.jumplist = [None, nvim.current.buffer.number]
     view.global_scale = view.get_scale_centered_on_text(buf_handler.get_current_text())
+    # lay out the whole scene once, later only the changed parts are
+    buf_handler.reposition_all()
     buf_handler.to_redraw.update(buf_handler.buf_num_to_text.keys())
-
-    buf_handler.jumplist = [None, nvim.current.buffer.number]
     buf_handler.update_all_texts()
 
     exit_code = app.exec()
+    view.llm_engine.cancel_all()
+    view.nvim_worker.stop()
     save_scene(buf_handler, nvim, workspace_dir)
+    if rpc_stats is not None:
+        stats_path = rpc_stats.dump(Config.rpc_stats_path)
+        print(f"rpc stats written to: {stats_path.as_posix()}")
+    if Config.tracing:
+        trace_path = tracer.export_chrome_trace(Config.trace_path)
+        print(f"trace written to: {trace_path.as_posix()}")
     sys.exit(exit_code)
 
 
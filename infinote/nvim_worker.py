@@ -0,0 +1,91 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+from PySide6.QtCore import QObject, Signal
+
+
+class NvimWorker(QObject):
+    # runs nvim calls in a separate thread, so that the GUI doesn't freeze
+    # while nvim is busy (f.e. when some plugin blocks it)
+    #
+    # pynvim sessions are not thread safe, so once the GUI runs, every nvim call
+    # must run as a job submitted here (only the loading, before that, calls nvim directly)
+    # jobs which need to touch Qt too are split: the nvim calls are the job,
+    # and the Qt part is its on_done
+
+    # emitted in the worker thread, but delivered in the GUI thread
+    _job_done = Signal(object, object)
+    _job_failed = Signal(object, object)
+
+    def __init__(self, nvim):
+        super().__init__()
+        self.nvim = nvim
+        self._jobs = queue.Queue()
+        # jobs submitted, whose on_done didn't run yet
+        self._num_pending = 0
+        self._pending_lock = threading.Lock()
+        self._job_done.connect(self._on_job_done)
+        self._job_failed.connect(self._on_job_failed)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, job, on_done=None, on_error=None) -> Future:
+        # job() runs in the worker thread, and then on_done(result) in the GUI thread
+        # if it raises, on_error(exception) runs instead, and the exception is reported
+        # (so the GUI state waiting for the job can be reset)
+        future = Future()
+        self._add_pending(1)
+        self._jobs.put((job, future, on_done, on_error))
+        return future
+
+    def wait(self):
+        # blocks until the submitted jobs are done (their on_done may still be queued)
+        self._jobs.join()
+
+    def is_idle(self):
+        # whether all the submitted jobs are done, and their on_done ran
+        return self._num_pending == 0
+
+    def _add_pending(self, delta):
+        with self._pending_lock:
+            self._num_pending += delta
+
+    def stop(self):
+        self._jobs.put((None, None, None, None))
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job, future, on_done, on_error = self._jobs.get()
+            if job is None:
+                self._jobs.task_done()
+                return
+            try:
+                result = job()
+            except Exception as e:
+                future.set_exception(e)
+                self._job_failed.emit(on_error, e)
+            else:
+                future.set_result(result)
+                if on_done is not None:
+                    self._job_done.emit(on_done, result)
+                else:
+                    self._add_pending(-1)
+            finally:
+                self._jobs.task_done()
+
+    def _on_job_done(self, on_done, result):
+        try:
+            on_done(result)
+        finally:
+            self._add_pending(-1)
+
+    def _on_job_failed(self, on_error, exception):
+        try:
+            if on_error is not None:
+                on_error(exception)
+        finally:
+            self._add_pending(-1)
+        # re-raise in the GUI thread, so errors are reported as before
+        raise exception
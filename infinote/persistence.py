@@ -1,12 +1,13 @@
-import json
 from pathlib import Path
 
 from colormath.color_conversions import convert_color
 from colormath.color_objects import HSLColor, LCHabColor
 from pynvim import Nvim
 
+from infinote.box_index import INDEX_FILENAME, BoxIndex, migrate_from_json
 from infinote.buffer_handling import BufferHandler
 from infinote.config import Config
+from infinote.journal import JOURNAL_FILENAME, Journal, clear_journal, read_journal
 from infinote.text_object import BoxInfo
 
 
@@ -20,90 +21,128 @@ def _name_to_hue(name: str):
     return hue
 
 
-def get_box_info(full_filename: Path):
-    info_path = full_filename.parent / "boxinfo" / f"{full_filename.stem}.json"  # NOSONAR
-    info = json.loads(info_path.read_text())
-    return BoxInfo(**info)
-
-
 def load_scene(buf_handler: BufferHandler, group_dir: Path):
     workspace_dir = group_dir.parent
     workspace_dir.mkdir(parents=True, exist_ok=True)
-    meta = {}
+    index_path = workspace_dir / INDEX_FILENAME
+    meta_path = workspace_dir / "meta.json"
+    is_new_workspace = not index_path.exists() and not meta_path.exists()
+    if is_new_workspace:
+        # if there is no index, top_dir should be empty
+        assert not any(workspace_dir.iterdir()), f"workspace_dir not empty: {workspace_dir}"
 
-    if not group_dir.exists():
+    box_index = BoxIndex(index_path)
+    buf_handler.box_index = box_index
+    if not box_index.load_hues() and meta_path.exists():
+        # workspace saved in the old format, with a json file per note
+        migrate_from_json(box_index, workspace_dir)
+    hues = box_index.load_hues()
+
+    journal_path = workspace_dir / JOURNAL_FILENAME
+    replayed = read_journal(journal_path)
+    if replayed:
+        # the last session didn't exit cleanly, so recover its changes from the journal
+        changed = {filename: info for filename, info in replayed.items() if info is not None}
+        deleted = [filename for filename, info in replayed.items() if info is None]
+        box_index.save(changed, {}, {}, deleted=deleted)
+        clear_journal(journal_path)
+        print(f"recovered {len(replayed)} box info changes from the journal")
+    buf_handler.journal = Journal(journal_path)
+
+    if group_dir.name not in hues:
         # save some initial hue for this dir
-        hue = _name_to_hue(group_dir.stem)
-        meta[group_dir.name] = dict(hue=hue)
-        buf_handler.savedir_hues[group_dir] = hue
+        hues[group_dir.name] = _name_to_hue(group_dir.stem)
 
-    meta_path = workspace_dir / "meta.json"
-    if not meta_path.exists():
+    # create the main subdir
+    group_dir.mkdir(exist_ok=True)
+
+    if is_new_workspace:
         print(f"opening a new workspace in {workspace_dir}")
-        # if there is no meta, top_dir should be empty
-        assert not any(workspace_dir.iterdir()), f"workspace_dir not empty: {workspace_dir}"
-        # create the main subdir
-        group_dir.mkdir(exist_ok=True)
-        (group_dir / "boxinfo").mkdir(exist_ok=True)
+        buf_handler.savedir_hues[group_dir] = hues[group_dir.name]
         # create one text
-        buf_handler.create_text(group_dir, BoxInfo())
+        # (while loading, nvim is called directly, not through the nvim worker)
+        buf_handler.add_text(BoxInfo(), *buf_handler.open_new_buffer(group_dir))
         return
 
-    # create the main subdir
-    group_dir.mkdir(exist_ok=True)
-    (group_dir / "boxinfo").mkdir(exist_ok=True)
-    meta.update(json.loads(meta_path.read_text()))
+    # all box infos are read at once from the index
+    boxes = box_index.load_boxes()
     subdirs = [d for d in workspace_dir.iterdir() if d.is_dir()]
     print(f"subdirs: {[dir.name for dir in subdirs]}")
-    filename_to_text = {}
+    to_open = []
+    full_filenames = []
     for subdir in subdirs:
         # load dir color
-        assert subdir.name in meta, f"alien folder: {subdir}"
-        buf_handler.savedir_hues[subdir] = meta[subdir.name]["hue"]
+        assert subdir.name in hues, f"alien folder: {subdir}"
+        buf_handler.savedir_hues[subdir] = hues[subdir.name]
 
-        # load files into buffers
+        # collect files to load into buffers
         files = [f for f in subdir.iterdir() if f.suffix in [".md", ".aichat"]]
         for full_filename in files:
             rel_filename = full_filename.relative_to(workspace_dir).as_posix()
             assert full_filename.stem.isnumeric(), f"names must be integers: {rel_filename}"
-            box_info = get_box_info(full_filename)
-
-            # create text
-            text = buf_handler.open_filename(box_info, full_filename.as_posix())
-            filename_to_text[full_filename] = text
+            box_info = boxes.get(rel_filename, BoxInfo())
+            to_open.append((box_info, full_filename.as_posix()))
+            full_filenames.append(full_filename)
 
         # prepare the next file number
         max_filenum = max(int(f.stem) for f in files) if files else 0
         buf_handler.last_file_nums[subdir] = max_filenum
 
-    # select the last active text
-    last_active_text = meta.get("active_text")
-    if last_active_text is not None:
+    last_active_text = box_index.get_meta("active_text")
+    if Config.lazy_materialization:
+        # create placeholder texts, and only open the active one now
+        # the rest is opened when it comes into view
+        texts = buf_handler.add_dormant_texts(to_open)
+        filename_to_text = dict(zip(full_filenames, texts))
+        active_full_filename = None
+        if last_active_text is not None:
+            active_full_filename = workspace_dir / last_active_text
+        if active_full_filename not in filename_to_text:
+            # the last active file may have been deleted since
+            active_full_filename = full_filenames[0] if full_filenames else None
+        if active_full_filename is not None:
+            active = [filename_to_text[active_full_filename]]
+            buf_handler.bind_opened_texts(active, buf_handler.open_dormant_texts(active))
+    else:
+        # create texts, opening all the files in a few batched calls
+        texts = buf_handler.open_filenames(to_open)
+        filename_to_text = dict(zip(full_filenames, texts))
+
+    # select the last active text, unless its file is gone
+    if last_active_text in buf_handler.filename_to_buf_num:
         buf_handler.jump_to_file(last_active_text)
 
-    # connect them
+    # connect them (a text whose parent is missing is kept as a root)
     for full_filename, text in filename_to_text.items():
-        box_info = get_box_info(full_filename)
-        if box_info.parent_filename:
-            parent_full_filename = workspace_dir / box_info.parent_filename
-            buf_handler.parents[text] = filename_to_text.get(parent_full_filename)
+        if text.parent_filename:
+            parent = filename_to_text.get(workspace_dir / text.parent_filename)
+            if parent is not None:
+                buf_handler.scene_graph.set_parent(text, parent)
 
     print(f"loaded {len(filename_to_text)} texts")
 
 
 def save_scene(buf_handler: BufferHandler, nvim: Nvim, workspace_dir: Path):
-    # save metadata json
-    meta = {}
-    for subdir, hue in buf_handler.savedir_hues.items():
-        meta[subdir.name] = dict(hue=hue)
-    meta["active_text"] = buf_handler.get_current_text().get_rel_filename()
-    meta_path = workspace_dir / "meta.json"
-    meta_path.write_text(json.dumps(meta, indent=4))
+    hues = {subdir.name: hue for subdir, hue in buf_handler.savedir_hues.items()}
+    meta = dict(active_text=buf_handler.get_current_text().get_rel_filename())
 
-    # save each text
+    # only the texts changed in this session need to be saved
+    boxes = {}
     for text in buf_handler.get_texts():
         if text.filename is None:
             # this buffer was not created by this program, so don't save it
             continue
-        text.persist_info()
-        text.save_text_buffer(nvim)
+        if text.dirty:
+            boxes[text.get_rel_filename()] = text.get_info()
+            text.dirty = False
+
+    # save all the changed box infos and metadata in one transaction
+    buf_handler.box_index.save(boxes, hues, meta, deleted=buf_handler.deleted_filenames)
+    buf_handler.deleted_filenames = []
+    buf_handler.box_index.close()
+
+    # everything in the journal is now in the index
+    buf_handler.journal.close()
+    clear_journal(buf_handler.journal.journal_path)
+
+    buf_handler.write_modified_buffers()
@@ -0,0 +1,102 @@
+import time
+
+from PySide6.QtCore import QObject, QTimer
+
+from infinote.config import Config
+from infinote.tracing import KEY_TO_PAINT, tracer
+
+
+class RedrawScheduler(QObject):
+    # coalesces bursts of keys (auto-repeat, fast typing), so the canvas doesn't lag behind:
+    # keys pressed while nvim still processes the previous ones are sent together,
+    # and at most one redraw runs per display frame
+    #
+    # a fetched state is not drawn if newer keys are already waiting, because it's
+    # superseded - unless the keys have waited for drawing longer than the latency budget
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self._pending_keys = []
+        # when each of the pending keys was pressed, and the processed, but not drawn ones
+        self._pending_key_times = []
+        self._processed_key_times = []
+        self._jobs_in_flight = 0
+        # when the oldest key which is not drawn yet was pressed
+        self._first_undrawn_time = None
+        self._last_redraw_time = 0
+        self._latest_state = None
+        self._frame_timer = QTimer()
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.timeout.connect(self._redraw_latest)
+
+    def add_key(self, text, raw_text):
+        # keys are never dropped, only delayed until the previous ones are processed
+        self._pending_keys.append((text, raw_text))
+        self._pending_key_times.append(time.perf_counter())
+        if self._first_undrawn_time is None:
+            self._first_undrawn_time = time.time()
+        if self._jobs_in_flight == 0:
+            self.send_pending_keys()
+
+    def send_pending_keys(self):
+        # also call it before running nvim calls in the GUI thread, to keep the key order
+        if not self._pending_keys:
+            return
+        keys = self._pending_keys
+        key_times = self._pending_key_times
+        self._pending_keys = []
+        self._pending_key_times = []
+        self._jobs_in_flight += 1
+        view = self.view
+
+        def job():
+            view.key_handler.handle_keys(keys)
+            return view.buf_handler.fetch_redraw_state()
+
+        def on_done(state):
+            self._on_keys_processed(state, key_times)
+
+        def on_error(_):
+            # the next keys must still be sent, so go on as if nvim was blocked
+            self._on_keys_processed(None, key_times)
+
+        view.nvim_worker.submit(job, on_done=on_done, on_error=on_error)
+
+    def _on_keys_processed(self, state, key_times):
+        self._jobs_in_flight -= 1
+        # (the keys of a superseded state are drawn with the next one)
+        self._processed_key_times.extend(key_times)
+        # (all the states are absorbed, even the superseded ones, see absorb_state)
+        self.view.buf_handler.absorb_state(state)
+        if state is not None:
+            self._latest_state = state
+        if self._pending_keys:
+            self.send_pending_keys()
+            waited = time.time() - self._first_undrawn_time
+            if waited < Config.redraw_latency_budget:
+                # this state is already superseded by the keys sent now
+                return
+        self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        if self._frame_timer.isActive():
+            # the redraw of this frame is already scheduled, and will use the latest state
+            return
+        wait = self._last_redraw_time + 1 / Config.redraw_fps - time.time()
+        self._frame_timer.start(max(0, int(wait * 1000)))
+
+    def _redraw_latest(self):
+        state = self._latest_state
+        self._latest_state = None
+        self._last_redraw_time = time.time()
+        if self._pending_keys or self._jobs_in_flight:
+            # some keys are still not drawn
+            self._first_undrawn_time = self._last_redraw_time
+        else:
+            self._first_undrawn_time = None
+
+        self.view.buf_handler.apply_redraw(state)
+        self.view._render_status_bar()
+        tracer.drawn(KEY_TO_PAINT, self._processed_key_times)
+        self._processed_key_times = []
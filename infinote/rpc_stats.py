@@ -0,0 +1,118 @@
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import msgpack
+
+# frames from these files are skipped when looking for the call site of a request
+_skipped_paths = ("pynvim", __file__)
+
+
+class _CallStats:
+    __slots__ = ("count", "total_time", "max_time", "sent_bytes", "received_bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+
+    def add(self, duration, sent_bytes, received_bytes):
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.sent_bytes += sent_bytes
+        self.received_bytes += received_bytes
+
+
+def _payload_size(obj):
+    # size of the msgpack encoding, with buffers, windows and tabpages as ext types
+    def default(o):
+        if hasattr(o, "code_data"):
+            return msgpack.ExtType(*o.code_data)
+        return str(o)
+
+    return len(msgpack.packb(obj, default=default))
+
+
+def _get_call_site():
+    frame = sys._getframe(2)
+    while frame is not None and any(p in frame.f_code.co_filename for p in _skipped_paths):
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return f"{Path(frame.f_code.co_filename).name}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+class RpcStats:
+    # opt-in instrumentation of all the nvim requests and notifications (see Config.rpc_stats)
+    # every pynvim call, also through nvim.api, buffers and windows, goes through
+    # nvim.request, so it's wrapped to record the method, the call site in infinote,
+    # the payload sizes and the round trip time
+    #
+    # it's only for measuring - it slows the calls down a bit, so it's off by default
+
+    def __init__(self, nvim):
+        self._request = nvim.request
+        nvim.request = self.request
+        self._lock = threading.Lock()
+        # (method, call site) -> _CallStats, since the start and since the last pop_recent
+        self._stats = defaultdict(_CallStats)
+        self._recent = defaultdict(_CallStats)
+
+    def request(self, name, *args, **kwargs):
+        call_site = _get_call_site()
+        start = time.perf_counter()
+        result = self._request(name, *args, **kwargs)
+        duration = time.perf_counter() - start
+
+        sent_bytes = _payload_size(args)
+        received_bytes = _payload_size(result)
+        # notifications don't wait for the response
+        method = f"{name} (notify)" if kwargs.get("async_") else name
+        with self._lock:
+            for stats in (self._stats, self._recent):
+                stats[method, call_site].add(duration, sent_bytes, received_bytes)
+        return result
+
+    def pop_recent(self):
+        # the stats since the previous call, f.e. of what one key press caused
+        with self._lock:
+            recent = self._recent
+            self._recent = defaultdict(_CallStats)
+        return recent
+
+    def get_status_message(self):
+        # summary of the calls since the previous status message
+        recent = self.pop_recent()
+        if not recent:
+            return None
+        count = sum(s.count for s in recent.values())
+        total_time = sum(s.total_time for s in recent.values())
+        (method, call_site), slowest = max(recent.items(), key=lambda item: item[1].total_time)
+        return (
+            f"rpc: {count} calls, {total_time * 1000:.1f}ms"
+            f" (most: {method} at {call_site}, {slowest.total_time * 1000:.1f}ms)"
+        )
+
+    def dump(self, path):
+        # write the stats of all the calls, the most time consuming first
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: -item[1].total_time)
+        lines = [
+            f"{'total ms':>10} {'calls':>7} {'mean ms':>8} {'max ms':>8}"
+            f" {'sent B':>10} {'recv B':>10}  method  call site"
+        ]
+        for (method, call_site), s in items:
+            lines.append(
+                f"{s.total_time * 1000:10.1f} {s.count:7} {s.total_time / s.count * 1000:8.2f}"
+                f" {s.max_time * 1000:8.2f} {s.sent_bytes:10} {s.received_bytes:10}"
+                f"  {method}  {call_site}"
+            )
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(lines) + "\n")
+        return path
@@ -0,0 +1,78 @@
+class SceneGraph:
+    # parent/children relations of the texts, with O(1) lookups in both directions
+    # children keep the order in which they were attached, which is their stacking order
+
+    def __init__(self):
+        self._parents = {}
+        # dicts are used as ordered sets
+        self._children = {}
+        self._roots = {}
+
+    def __contains__(self, text):
+        return text in self._parents
+
+    def add(self, text, parent=None):
+        self._parents[text] = None
+        self._children[text] = {}
+        self._roots[text] = None
+        if parent is not None:
+            self.set_parent(text, parent)
+
+    def remove(self, text):
+        # its children become roots
+        self.reparent(self.get_children(text), None)
+        self.detach(text)
+        del self._parents[text]
+        del self._children[text]
+        del self._roots[text]
+
+    def set_parent(self, child, parent):
+        self._unlink(child)
+        self._parents[child] = parent
+        self._children[parent][child] = None
+        self._roots.pop(child, None)
+        child.invalidate_plane_scale()
+
+    def detach(self, child):
+        # make it a root
+        if self._parents[child] is None:
+            return
+        self._unlink(child)
+        self._roots[child] = None
+        child.invalidate_plane_scale()
+
+    def reparent(self, children, parent):
+        # parent=None detaches them all
+        for child in children:
+            if parent is None:
+                self.detach(child)
+            else:
+                self.set_parent(child, parent)
+
+    def _unlink(self, child):
+        parent = self._parents[child]
+        if parent is not None:
+            del self._children[parent][child]
+        self._parents[child] = None
+
+    def get_parent(self, text):
+        return self._parents.get(text)
+
+    def get_children(self, text):
+        return list(self._children.get(text, ()))
+
+    def get_roots(self):
+        return list(self._roots)
+
+    def get_root(self, text):
+        while self._parents[text] is not None:
+            text = self._parents[text]
+        return text
+
+    def get_depth(self, text):
+        # 0 for a root
+        depth = 0
+        while self._parents[text] is not None:
+            text = self._parents[text]
+            depth += 1
+        return depth
@@ -0,0 +1,195 @@
+import heapq
+import itertools
+
+# rects are (left, top, right, bottom) tuples, in plane coords
+
+
+def _contains(outer, inner):
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and inner[2] <= outer[2]
+        and inner[3] <= outer[3]
+    )
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _center(rect):
+    return (rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2
+
+
+def _distance_to_rect(point, rect):
+    dx = max(rect[0] - point[0], 0, point[0] - rect[2])
+    dy = max(rect[1] - point[1], 0, point[1] - rect[3])
+    return (dx**2 + dy**2) ** 0.5
+
+
+def _in_direction(diff, direction):
+    x, y = diff
+    return (
+        (direction == "down" and y >= abs(x))
+        or (direction == "right" and x >= abs(y))
+        or (direction == "up" and y <= -abs(x))
+        or (direction == "left" and x <= -abs(y))
+    )
+
+
+def _may_contain_direction(point, rect, direction):
+    # whether any point of the rect lies in that direction's 90 degree cone from the point
+    px, py = point
+    left, top, right, bottom = rect
+    if direction in ("left", "right"):
+        farthest = right - px if direction == "right" else px - left
+        lo, hi = top - py, bottom - py
+    else:
+        farthest = bottom - py if direction == "down" else py - top
+        lo, hi = left - px, right - px
+    closest_sideways = 0 if lo <= 0 <= hi else min(abs(lo), abs(hi))
+    return farthest >= closest_sideways
+
+
+class _Node:
+    __slots__ = ("rect", "items", "children")
+
+    def __init__(self, rect):
+        self.rect = rect
+        # dict used as an ordered set
+        self.items = {}
+        self.children = None
+
+    def get_child_rects(self):
+        left, top, right, bottom = self.rect
+        mid_x = (left + right) / 2
+        mid_y = (top + bottom) / 2
+        return [
+            (left, top, mid_x, mid_y),
+            (mid_x, top, right, mid_y),
+            (left, mid_y, mid_x, bottom),
+            (mid_x, mid_y, right, bottom),
+        ]
+
+
+class SpatialIndex:
+    # quadtree over the plane rects of the texts, for queries which would otherwise
+    # scan all of them: neighbors in a direction, and texts in some region
+    #
+    # an item is kept in the deepest node which fully contains it, and it's
+    # updated incrementally when its rect changes (see DraggableText.reposition)
+
+    _max_items = 8
+    # nodes smaller than this fraction of the root are not split anymore, which bounds
+    # the depth (plane units have no fixed size - with autoshrink boxes can be tiny)
+    _min_node_fraction = 2**-20
+
+    def __init__(self):
+        self._root = None
+        self._rects = {}
+        self._nodes = {}
+
+    def __contains__(self, item):
+        return item in self._rects
+
+    def update(self, item, rect):
+        # insert the item, or move it if its rect changed
+        if self._rects.get(item) == rect:
+            return
+        if item in self._rects:
+            self.remove(item)
+        self._rects[item] = rect
+        if self._root is None:
+            # (a degenerate rect still needs a root which can grow)
+            size = max(rect[2] - rect[0], rect[3] - rect[1]) or 1
+            self._root = _Node((rect[0], rect[1], rect[0] + size * 2, rect[1] + size * 2))
+        while not _contains(self._root.rect, rect):
+            self._grow_root(rect)
+        self._insert(self._root, item, rect)
+
+    def remove(self, item):
+        rect = self._rects.pop(item, None)
+        if rect is None:
+            return
+        node = self._nodes.pop(item)
+        del node.items[item]
+
+    def query(self, rect):
+        # items whose rects intersect the rect
+        found = set()
+        if self._root is None:
+            return found
+        to_visit = [self._root]
+        while to_visit:
+            node = to_visit.pop()
+            if not _intersects(node.rect, rect):
+                continue
+            for item in node.items:
+                if _intersects(self._rects[item], rect):
+                    found.add(item)
+            if node.children is not None:
+                to_visit.extend(node.children)
+        return found
+
+    def nearest_in_direction(self, point, direction, exclude=None):
+        # the item whose center is closest to the point, among the ones in the
+        # 90 degree cone in that direction ("up", "down", "left" or "right")
+        # best-first search - nodes are visited in the order of their distance
+        if self._root is None:
+            return None
+        counter = itertools.count()
+        heap = [(0, next(counter), self._root, None)]
+        while heap:
+            _, _, node, item = heapq.heappop(heap)
+            if item is not None:
+                # items are pushed with their exact distance, so this is the closest
+                return item
+            for candidate in node.items:
+                if candidate is exclude:
+                    continue
+                x, y = _center(self._rects[candidate])
+                diff = (x - point[0], y - point[1])
+                if _in_direction(diff, direction):
+                    distance = (diff[0] ** 2 + diff[1] ** 2) ** 0.5
+                    heapq.heappush(heap, (distance, next(counter), None, candidate))
+            for child in node.children or []:
+                if _may_contain_direction(point, child.rect, direction):
+                    distance = _distance_to_rect(point, child.rect)
+                    heapq.heappush(heap, (distance, next(counter), child, None))
+        return None
+
+    def _insert(self, node, item, rect):
+        while node.children is not None:
+            child = next((c for c in node.children if _contains(c.rect, rect)), None)
+            if child is None:
+                break
+            node = child
+        node.items[item] = None
+        self._nodes[item] = node
+        if node.children is None and len(node.items) > self._max_items:
+            self._split(node)
+
+    def _split(self, node):
+        root_width = self._root.rect[2] - self._root.rect[0]
+        if node.rect[2] - node.rect[0] < root_width * self._min_node_fraction:
+            return
+        node.children = [_Node(rect) for rect in node.get_child_rects()]
+        items = list(node.items)
+        node.items = {}
+        for item in items:
+            self._insert(node, item, self._rects[item])
+
+    def _grow_root(self, rect):
+        # double the root towards the rect, the old root becomes one of the quadrants
+        old = self._root
+        left, top, right, bottom = old.rect
+        width, height = right - left, bottom - top
+        grow_left = rect[0] < left
+        grow_up = rect[1] < top
+        new_left = left - width if grow_left else left
+        new_top = top - height if grow_up else top
+        new_root = _Node((new_left, new_top, new_left + width * 2, new_top + height * 2))
+        new_root.children = [_Node(child_rect) for child_rect in new_root.get_child_rects()]
+        old_index = (1 if grow_left else 0) + (2 if grow_up else 0)
+        new_root.children[old_index] = old
+        self._root = new_root
@@ -1,20 +1,31 @@
 from dataclasses import dataclass
-import json
 from pathlib import Path
 import re
 from typing import Tuple
 
-from PySide6.QtCore import QPointF, Qt
+from PySide6.QtCore import QPoint, QPointF, QRect, QRectF, Qt
 from PySide6.QtGui import (
+    QAbstractTextDocumentLayout,
     QColor,
     QFontMetrics,
+    QPainter,
+    QPixmap,
     QTextBlockFormat,
     QTextCharFormat,
     QTextCursor,
+    QTextDocument,
+)
+from PySide6.QtWidgets import (
+    QGraphicsItem,
+    QGraphicsProxyWidget,
+    QStyleOptionGraphicsItem,
+    QTextBrowser,
+    QTextEdit,
 )
-from PySide6.QtWidgets import QGraphicsProxyWidget, QTextBrowser, QTextEdit
 
 from infinote.config import Config
+from infinote.display_model import DisplayModel
+from infinote.tracing import traced
 
 # from PySide6.QtWidgets import QGraphicsDropShadowEffect
 
@@ -45,51 +56,219 @@ class IgnoringKeysTextEdit(QTextEdit):
         event.ignore()
 
 
+class DocumentBox:
+    # a stand-in for the QTextEdit of a text box, used with the "painter" box backend:
+    # there is no widget per box, the owning item paints the document itself
+    # it implements only the part of the QTextEdit interface which the renderer uses
+
+    _frame_width = 1
+
+    def __init__(self):
+        self._document = QTextDocument()
+        self._cursor = QTextCursor(self._document)
+        self._width = Config.text_width
+        self._height = Config.text_max_height
+        self._has_focus = False
+        # (set by the renderer, see set_colors)
+        self.background_color = QColor(Config.background_color)
+        self.border_color = QColor()
+        self.text_color = QColor()
+        # the graphics item which paints it, so it can be told to repaint
+        self.item = None
+
+    def _changed(self):
+        if self.item is not None:
+            self.item.update()
+
+    def document(self):
+        return self._document
+
+    def textCursor(self):
+        return QTextCursor(self._cursor)
+
+    def setTextCursor(self, cursor):
+        self._cursor = QTextCursor(cursor)
+        self._changed()
+
+    def setPlainText(self, text):
+        self._document.setPlainText(text)
+
+    def setFocus(self):
+        # only makes the caret drawn
+        self._has_focus = True
+        self._changed()
+
+    def clearFocus(self):
+        self._has_focus = False
+        self._changed()
+
+    def setFixedWidth(self, width):
+        self._width = width
+        self._document.setTextWidth(width - 2 * self._frame_width)
+
+    def setFixedHeight(self, height):
+        self._height = height
+        self._changed()
+
+    def set_colors(self, border_color, text_color):
+        # instead of a stylesheet
+        self.border_color = border_color
+        self.text_color = text_color
+        self._changed()
+
+    def viewport(self):
+        # the document is drawn right inside the frame, like in the QTextEdit viewport
+        return self
+
+    def mapTo(self, widget, point):
+        return point + QPoint(self._frame_width, self._frame_width)
+
+    def cursorRect(self, cursor):
+        # in the document coordinates, like in QTextEdit, where it's in viewport coordinates
+        block = cursor.block()
+        block_rect = self._document.documentLayout().blockBoundingRect(block)
+        pos_in_block = cursor.position() - block.position()
+        line = block.layout().lineForTextPosition(pos_in_block)
+        if not line.isValid():
+            return QRect(block_rect.topLeft().toPoint(), block_rect.size().toSize())
+        x = line.cursorToX(pos_in_block)[0]
+        return QRect(
+            int(block_rect.x() + x),
+            int(block_rect.y() + line.y()),
+            1,
+            int(line.height()),
+        )
+
+    def set_cursor_at(self, point):
+        # place the cursor at a click position, given in the box coordinates
+        doc_point = point - QPointF(self._frame_width, self._frame_width)
+        pos = self._document.documentLayout().hitTest(doc_point, Qt.FuzzyHit)
+        if pos != -1:
+            self._cursor.setPosition(pos)
+
+    def paint(self, painter, rect):
+        painter.fillRect(rect, self.background_color)
+        painter.save()
+        inner = rect.adjusted(
+            self._frame_width, self._frame_width, -self._frame_width, -self._frame_width
+        )
+        painter.setClipRect(inner)
+        painter.translate(inner.topLeft())
+        context = QAbstractTextDocumentLayout.PaintContext()
+        context.palette.setColor(context.palette.ColorRole.Text, self.text_color)
+        context.clip = QRectF(0, 0, inner.width(), inner.height())
+        if self._has_focus:
+            context.cursorPosition = self._cursor.position()
+        self._document.documentLayout().draw(painter, context)
+        painter.restore()
+        painter.setPen(self.border_color)
+        painter.drawRect(rect.adjusted(0, 0, -1, -1))
+
+    def grab(self):
+        pixmap = QPixmap(int(self._width), int(self._height))
+        painter = QPainter(pixmap)
+        self.paint(painter, QRectF(0, 0, self._width, self._height))
+        painter.end()
+        return pixmap
+
+
+def _get_labels(extmarks):
+    # get (y, x, char) of the extmark labels (mainly for the leap plugin), 0-based
+    labels = []
+    for _, y, x, details in extmarks:
+        if "virt_text" not in details:
+            continue
+        virt_text = details["virt_text"]
+        assert len(virt_text) == 1, virt_text
+        char, type_ = virt_text[0]
+        if type_ == "Cursor":
+            continue
+        # maybeTODO later relax this?
+        assert type_ in ["LeapLabelPrimary", "LeapLabelSecondary"], extmarks
+        labels.append((y, x, char))
+    return labels
+
+
 class TextboxInsidesRenderer:
     def __init__(
-        self, hue, init_folds, init_signs, style=None, set_width=True, brightness_multiplier=1
+        self,
+        hue,
+        init_folds,
+        init_sign_lines,
+        style=None,
+        set_width=True,
+        brightness_multiplier=1,
+        outline=False,
+        backend="widget",
     ):
-        self.text_box = IgnoringKeysTextEdit()
+        # the "painter" backend has no widget, its box paints the document (see DocumentBox)
+        if backend == "painter":
+            self.text_box = DocumentBox()
+        else:
+            self.text_box = IgnoringKeysTextEdit()
         if set_width:
             self.text_box.setFixedWidth(Config.text_width)
         self.folds = init_folds
-        self._set_sign_lines(init_signs)
+        self.sign_lines = set(init_sign_lines)
         self.cursor_pos = 0
-
-        if style is None:
-            style = f"""
-                QTextEdit {{
-                    background-color: {Config.background_color};
-                    border: 1px solid hsl({hue}, 96%, {Config.border_brightness:.0%});
-                    color: hsl({hue}, 96%, {Config.text_brightness:.0%});
-                }}
-                QScrollBar:vertical {{
-                    width: 15px;
-                    background: {Config.background_color};
-                }}
-                QScrollBar::handle:vertical {{
-                    background-color: hsl({hue}, 96%, {Config.border_brightness:.0%});
-                }}
-            """
-        self.text_box.setStyleSheet(style)
+        self.hue = hue
+        self.backend = backend
+
+        if backend == "painter":
+            # no stylesheet, the box gets its colors directly
+            # (the same as the ones of the default style below)
+            self.text_box.set_colors(
+                QColor.fromHslF(hue / 360, 0.96, Config.border_brightness),
+                QColor.fromHslF(hue / 360, 0.96, Config.text_brightness),
+            )
+        else:
+            if style is None:
+                style = f"""
+                    QTextEdit {{
+                        background-color: {Config.background_color};
+                        border: 1px solid hsl({hue}, 96%, {Config.border_brightness:.0%});
+                        color: hsl({hue}, 96%, {Config.text_brightness:.0%});
+                    }}
+                    QScrollBar:vertical {{
+                        width: 15px;
+                        background: {Config.background_color};
+                    }}
+                    QScrollBar::handle:vertical {{
+                        background-color: hsl({hue}, 96%, {Config.border_brightness:.0%});
+                    }}
+                """
+            self.text_box.setStyleSheet(style)
         self.text_color = QColor()
         self.text_color.setHsl(hue, 96, int(Config.text_brightness * 100))
         self.selection_color = QColor()
         self.selection_color.setHsl(hue, 96, int(Config.selection_brightness * 100))
         self._border_glowing = False
         self.brightness_multiplier = brightness_multiplier
-        self.line_nums_shown = None
+        # called after the box colors change, set by the owner of the box
+        self.on_style_changed = None
+        # what the document blocks currently contain, to only patch the changed ones
+        self._rendered_lines = []
+        # blocks with highlights, which need their formatting reset on the next update
+        self._highlighted_blocks = set()
+        # for each block, whether it's shown (see _apply_visibility)
+        self._visible = []
+        # outline texts hide unimportant lines (see DisplayModel)
+        self.outline = outline
+        self.display = DisplayModel([])
+        # bumped whenever the displayed content changes, so the box height, which only
+        # depends on it, doesn't need to be measured again otherwise (see DraggableText)
+        self.layout_revision = 0
 
         doc = self.text_box.document()
         doc.setIndentWidth(1)
 
     def _yx_to_pos(self, y, x):
         # get the one number char position
+        # (hidden lines are still in the document, so block numbers are real line numbers)
         doc = self.text_box.document()
-        return doc.findBlockByLineNumber(y - 1).position() + x
+        return doc.findBlockByNumber(y - 1).position() + x
 
     def _pos_to_yx(self, pos):
-        # todo this will fail if some lines are hidden
         doc = self.text_box.document()
         block = doc.findBlock(pos)
         y = block.blockNumber() + 1
@@ -111,6 +290,7 @@ class TextboxInsidesRenderer:
         cursor.setPosition(start_pos, QTextCursor.MoveAnchor)
         cursor.setPosition(end_pos, QTextCursor.KeepAnchor)
         cursor.mergeCharFormat(color_format)
+        self._highlighted_blocks.update(range(start[0] - 1, end[0]))
 
     def _get_blocks(self):
         doc = self.text_box.document()
@@ -119,35 +299,39 @@ class TextboxInsidesRenderer:
             yield block
             block = block.next()
 
-    def sync_qt_cursor_into_vim(self, nvim):
+    def get_qt_cursor_pos(self):
+        # the (line, col) in nvim coords of the qt cursor, f.e. after a click
         cursor = self.text_box.textCursor()
         cursor_pos = cursor.position()
         y, x = self._pos_to_yx(cursor_pos)
-        if self.line_nums_shown is not None:
-            # get the real line number
-            y = self.line_nums_shown[y - 1] + 1
-        nvim.api.win_set_cursor(0, (y, x))
+        # the qt cursor can only be on a shown line, f.e. a fold head, which is a real line
+        y = self.display.representative(y - 1) + 1
+        return y, x
 
-    def if_qt_selection_sync_into_vim(self, nvim):
+    def pop_qt_selection(self):
+        # the start and end (line, col) of the qt selection, or None if there's none
+        # the selection is cleared in qt, nvim will draw it once it's selected there
         # cursors https://doc.qt.io/qt-6/qtextedit.html#using-qtextedit-as-an-editor
         cursor = self.text_box.textCursor()
-        # check if editor has selection
         if not cursor.hasSelection():
-            return
-
-        y_start, x_start = self._pos_to_yx(cursor.selectionStart())
-        y_end, x_end = self._pos_to_yx(cursor.selectionEnd() - 1)
-
-        nvim.input("<Esc>")
-        nvim.api.win_set_cursor(0, (y_start, x_start))
-        nvim.input("v")
-        nvim.api.win_set_cursor(0, (y_end, x_end))
+            return None
+        start = self._pos_to_yx(cursor.selectionStart())
+        end = self._pos_to_yx(cursor.selectionEnd() - 1)
+        cursor.clearSelection()
+        self.text_box.setTextCursor(cursor)
+        return start, end
 
-    def _format_displayed_lines(self):
+    @traced
+    def _format_blocks(self, block_nums):
         # set the fancy formatting, with nice indents and decreasing font sizes
+        # (it also clears any highlights in those blocks)
+        doc = self.text_box.document()
         cursor = self.text_box.textCursor()
         block_format = QTextBlockFormat()
-        for block in self._get_blocks():
+        for block_num in sorted(block_nums):
+            block = doc.findBlockByNumber(block_num)
+            if not block.isValid():
+                continue
             line = block.text()
             cursor.setPosition(block.position(), QTextCursor.MoveAnchor)
             cursor.setPosition(block.position() + len(line), QTextCursor.KeepAnchor)
@@ -171,11 +355,90 @@ class TextboxInsidesRenderer:
             block_format.setTextIndent(-indent_width)
             cursor.setBlockFormat(block_format)
 
+    @traced
+    def _patch_document(self, new_lines):
+        # replace only the blocks which differ from what is rendered,
+        # returning the numbers of blocks which need formatting
+        old_lines = self._rendered_lines
+        self._rendered_lines = new_lines
+        if not old_lines:
+            self.text_box.setPlainText("\n".join(new_lines))
+            self._visible = [True] * len(new_lines)
+            return set(range(len(new_lines)))
+
+        # find the changed middle part, between the common prefix and suffix
+        max_common = min(len(old_lines), len(new_lines))
+        prefix = 0
+        while prefix < max_common and old_lines[prefix] == new_lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < max_common - prefix
+            and old_lines[-1 - suffix] == new_lines[-1 - suffix]
+        ):
+            suffix += 1
+        old_end = len(old_lines) - suffix
+        new_end = len(new_lines) - suffix
+        if prefix == old_end and prefix == new_end:
+            return set()
+
+        doc = self.text_box.document()
+        cursor = QTextCursor(doc)
+        cursor.beginEditBlock()
+        new_middle = "\n".join(new_lines[prefix:new_end])
+        if prefix < old_end and prefix < new_end:
+            # replace the changed blocks
+            cursor.setPosition(doc.findBlockByNumber(prefix).position())
+            last = doc.findBlockByNumber(old_end - 1)
+            cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+            cursor.insertText(new_middle)
+        elif prefix < new_end:
+            # only insert blocks
+            if prefix < len(old_lines):
+                cursor.setPosition(doc.findBlockByNumber(prefix).position())
+                cursor.insertText(new_middle + "\n")
+            else:
+                last = doc.findBlockByNumber(prefix - 1)
+                cursor.setPosition(last.position() + last.length() - 1)
+                cursor.insertText("\n" + new_middle)
+        else:
+            # only delete blocks
+            if old_end < len(old_lines):
+                cursor.setPosition(doc.findBlockByNumber(prefix).position())
+                cursor.setPosition(
+                    doc.findBlockByNumber(old_end).position(), QTextCursor.KeepAnchor
+                )
+            else:
+                before = doc.findBlockByNumber(prefix - 1)
+                last = doc.findBlockByNumber(old_end - 1)
+                cursor.setPosition(before.position() + before.length() - 1)
+                cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+        cursor.endEditBlock()
+
+        # the new blocks may have inherited visibility from their neighbors
+        shift = new_end - old_end
+        changed = range(prefix, new_end)
+        self._visible[prefix:old_end] = [None] * (new_end - prefix)
+        for block_num in changed:
+            doc.findBlockByNumber(block_num).setVisible(True)
+            self._visible[block_num] = True
+        if new_end < len(new_lines):
+            # the block after the change could have been split, so recheck it
+            self._visible[new_end] = None
+
+        # highlighted blocks after the change moved
+        self._highlighted_blocks = {
+            num if num < prefix else num + shift
+            for num in self._highlighted_blocks
+            if num < prefix or num >= old_end
+        }
+        return set(changed)
+
+    @traced
     def update_text(self, lines, extmarks):
-        # maybeTODO optimization:
-        # only during leaps all of the texts will be redrawn, so that can
-        # become really slow - otherwise it's ok
-        #  then I could go back to additionally checking if extmark changed
+        # only the changed lines are replaced in the document and formatted again,
+        # so the cost is proportional to the edit, not to the text length
 
         # add space to empty lines so that cursor can be displayed there
         for i, line in enumerate(lines):
@@ -183,26 +446,25 @@ class TextboxInsidesRenderer:
                 lines[i] = " "
 
         # set marks text (mainly for the leap plugin)
+        # (text boxes draw them with a LabelOverlay instead, without re-rendering)
         mark_positions = []
-        for _, y, x, details in extmarks:
-            if "virt_text" not in details:
-                continue
-            virt_text = details["virt_text"]
-            assert len(virt_text) == 1, virt_text
-            char, type_ = virt_text[0]
-            if type_ == "Cursor":
-                continue
-            # maybeTODO later relax this?
-            assert type_ in ["LeapLabelPrimary", "LeapLabelSecondary"], extmarks
+        for y, x, char in _get_labels(extmarks):
             # put that char into text
             lines[y] = lines[y][:x] + char + lines[y][x + 1 :]
             mark_positions.append((y, x))
 
-        # set new text
-        new_text = "\n".join(lines)
-        self.text_box.setText(new_text)
+        # decide what is shown first, so that nothing needs to be deleted after rendering
+        self.display = DisplayModel(lines, self.folds, self.sign_lines, outline=self.outline)
 
-        self._format_displayed_lines()
+        # set new text, reformatting the changed blocks and those which had highlights
+        to_format = self._patch_document(self.display.displayed_lines)
+        # (reformatting the highlighted blocks only resets their colors, not the layout)
+        if to_format or self._visible != self.display.visible:
+            self.layout_revision += 1
+        to_format |= self._highlighted_blocks
+        self._highlighted_blocks = set()
+        self._format_blocks(to_format)
+        self._apply_visibility(self.display.visible)
 
         # highlight the chars
         for y, x in mark_positions:
@@ -212,20 +474,22 @@ class TextboxInsidesRenderer:
         cursor = self.text_box.textCursor()
         cursor.setPosition(0)
         self.text_box.setTextCursor(cursor)
+        self.text_box.clearFocus()
 
         # make sure border is not glowing
         self.set_border_glow(False)
 
+    def set_buf_info(self, cur_buf_info):
+        # folds and signs are only known for the current buffer, so the other texts
+        # keep the ones from when they were current - call it before update_text
+        self.folds = cur_buf_info["folds"]
+        self.sign_lines = set(cur_buf_info["sign_lines"])
+
+    @traced
     def update_current_text(self, mode_info, cur_buf_info, lines):
         # this function if called only if this node's buffer is the current buffer
         mode = mode_info["mode"]
 
-        # get folds for potential future fold drawing
-        self.folds = cur_buf_info["folds"]
-
-        # get highlight bookmarks for potential future drawing
-        self._set_sign_lines(cur_buf_info["bookmark_info"])
-
         # set selection
         if mode == "v" or mode == "V" or mode == "\x16":
             s = cur_buf_info["selection_start"][1:3]
@@ -250,10 +514,15 @@ class TextboxInsidesRenderer:
         # make the text border glow
         self.set_border_glow(True)
 
+    @traced
     def draw_cursor(self, mode_info, cur_buf_info):
         mode = mode_info["mode"]
         # set cursor
         curs_y, curs_x = cur_buf_info["cursor_position"]
+        if self.display.representative(curs_y - 1) != curs_y - 1:
+            # cursor is inside a closed fold or a hidden line, so show it on the line standing for it
+            curs_y = self.display.representative(curs_y - 1) + 1
+            curs_x = 0
         pos = self._yx_to_pos(curs_y, curs_x)
         if mode == "n":
             _yx_pos = (curs_y, curs_x + 1)
@@ -263,85 +532,41 @@ class TextboxInsidesRenderer:
             self.text_box.setFocus()
         self.cursor_pos = pos
 
-    def hide_folds(self):
-        if self.folds == []:
-            return
-        # set folds
-        head_lines = set()
-        hidden_lines = set()
-        for fold in self.folds:
-            head_lines.add(fold[0])
-            current = fold[0] + 1
-            while current <= fold[1]:
-                hidden_lines.add(current)
-                current += 1
-
-        block = self.text_box.document().begin()
-        cursor = self.text_box.textCursor()
-        line_num = 1
-        while block.isValid():
-            if line_num in hidden_lines:
-                cursor.setPosition(block.position())
-                cursor.select(QTextCursor.BlockUnderCursor)
-                block = block.next()
-                cursor.removeSelectedText()
-            elif line_num in head_lines:
-                cursor.setPosition(block.position() + block.length() - 1)
-                cursor.insertText(" ...")
-                block = block.next()
-            else:
-                block = block.next()
-            line_num += 1
-
-    def hide_unimportant_lines(self):
-        lines = self.text_box.toPlainText().split("\n")
-        line_nums_to_hide = []
-        self.line_nums_shown = []
-        for i, line in enumerate(lines):
-            if (
-                # keep lines with a non-space character at the beginning
-                re.match(r"^\S", line)
-                # keep empty lines
-                or line.strip() == ""
-                # keep lines with "- !" or "- ?" or "!" or "?" at the beginning
-                or Config.highlight_lines_regex.match(line)
-                # keep bookmarked lines
-                or i + 1 in self.sign_lines
-            ):
-                self.line_nums_shown.append(i)
+    def get_char_geometry(self, y, x, char):
+        # the rect (in text_box coordinates) and the font for drawing a char over the text
+        # at this position, 0-based
+        # it uses the existing layout, so it doesn't cause relayouting
+        doc = self.text_box.document()
+        block = doc.findBlockByNumber(y)
+        if not block.isValid() or not block.isVisible():
+            return None
+        pos = block.position() + min(x, block.length() - 1)
+        cursor = QTextCursor(block)
+        cursor.setPosition(pos)
+        cursor_rect = self.text_box.cursorRect(cursor)
+        # char format is taken from the char before the cursor
+        cursor.setPosition(min(pos + 1, block.position() + block.length() - 1))
+        font = cursor.charFormat().font()
+
+        top_left = self.text_box.viewport().mapTo(self.text_box, cursor_rect.topLeft())
+        width = QFontMetrics(font).horizontalAdvance(char)
+        rect = QRectF(top_left.x(), top_left.y(), width, cursor_rect.height())
+        return rect, font
+
+    @traced
+    def _apply_visibility(self, visible):
+        # hidden blocks stay in the document (only their visibility changes),
+        # so that next updates can still be diffed against them
+        doc = self.text_box.document()
+        for i, (old, new) in enumerate(zip(self._visible, visible)):
+            if old == new:
                 continue
-            line_nums_to_hide.append(i)
-
-        # draw + signs on lines starting with "-" and having indented sublines
-        line_nums_minus_to_plus = []
-        for i, line in enumerate(lines[:-1]):
-            next_line = lines[i + 1]
-            if re.match(r"^-", line) and re.match(r"^\s+\S", next_line):
-                line_nums_minus_to_plus.append(i)
-
-        # delete the lines
-        # note: it would be more efficient to only draw from the start what is necessary
-        # but that complicates text marking positionings
-        # maybe do it in the future if this part looks slow during profiling
-        block = self.text_box.document().begin()
-        cursor = self.text_box.textCursor()
-        line_num = 0
-        while block.isValid():
-            if line_num in line_nums_to_hide:
-                cursor.setPosition(block.position())
-                cursor.select(QTextCursor.BlockUnderCursor)
-                block = block.next()
-                cursor.removeSelectedText()
-            elif line_num in line_nums_minus_to_plus:
-                # replace first char ("-") with "+"
-                cursor.setPosition(block.position())
-                cursor.movePosition(QTextCursor.NextCharacter, QTextCursor.KeepAnchor)
-                cursor.insertText("+")
-                block = block.next()
-            else:
-                block = block.next()
-            line_num += 1
+            block = doc.findBlockByNumber(i)
+            block.setVisible(new)
+            doc.markContentsDirty(block.position(), block.length())
+        self._visible = list(visible)
 
+    @traced
     def highlight_special_lines(self, lines):
         for i, line in enumerate(lines):
             # highlight sign_lines or those matching the regex
@@ -349,13 +574,6 @@ class TextboxInsidesRenderer:
                 line_width = len(line)
                 self.highlight(Config.sign_color, (i + 1, 1), (i + 1, line_width))
 
-    def _set_sign_lines(self, signs):
-        if signs != []:
-            signs = signs[0]["signs"]
-            self.sign_lines = [sign["lnum"] for sign in signs]
-        else:
-            self.sign_lines = []
-
     def set_invisible_cursor_pos(self):
         # to prevent weird line glitches, we need to set always the same cursor font
         # and have it as a normal caret, not selection
@@ -373,13 +591,59 @@ class TextboxInsidesRenderer:
         # replace border brightness
         brightness = Config.text_brightness if state else Config.border_brightness
         brightness *= self.brightness_multiplier
-        style = re.sub(
-            r"(border: 1px solid hsl\(.*, .*,) (.*)\);",
-            rf"\1 {brightness:.0%});",
-            self.text_box.styleSheet(),
-        )
-        self.text_box.setStyleSheet(style)
+        if self.backend == "painter":
+            border_color = QColor.fromHslF(self.hue / 360, 0.96, brightness)
+            self.text_box.set_colors(border_color, self.text_box.text_color)
+        else:
+            style = re.sub(
+                r"(border: 1px solid hsl\(.*, .*,) (.*)\);",
+                rf"\1 {brightness:.0%});",
+                self.text_box.styleSheet(),
+            )
+            self.text_box.setStyleSheet(style)
         self._border_glowing = state
+        if self.on_style_changed is not None:
+            self.on_style_changed()
+
+
+class LabelOverlay(QGraphicsItem):
+    # extmark labels (f.e. of leap hops) drawn on top of a text box,
+    # so that the box doesn't need to be re-rendered when they appear or disappear
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self._labels = []
+        self._bounding_rect = QRectF()
+        self._text_color = QColor()
+
+    def set_labels(self, renderer, labels):
+        # labels are (y, x, char), 0-based
+        drawn = []
+        for y, x, char in labels:
+            geometry = renderer.get_char_geometry(y, x, char)
+            if geometry is None:
+                # the line is hidden
+                continue
+            rect, font = geometry
+            drawn.append((rect, font, char))
+
+        self.prepareGeometryChange()
+        self._labels = drawn
+        self._bounding_rect = QRectF()
+        for rect, _, _ in drawn:
+            self._bounding_rect = self._bounding_rect.united(rect)
+        self._text_color = renderer.text_color
+        self.update()
+
+    def boundingRect(self):
+        return self._bounding_rect
+
+    def paint(self, painter, option, widget=None):
+        for rect, font, char in self._labels:
+            painter.fillRect(rect, QColor("brown"))
+            painter.setFont(font)
+            painter.setPen(self._text_color)
+            painter.drawText(rect, Qt.AlignCenter, char)
 
 
 @dataclass
@@ -392,6 +656,8 @@ class BoxInfo:
     # otherwise, it's a tuple with x and y relative position to the parent
     pos_rel_to_parent: Tuple[float, float] | None = None
     parent_filename: str | None = None
+    # last rendered height, so that the box can be drawn before its text is loaded
+    cached_height: float = Config.text_max_height
 
     @property
     def plane_pos_vect(self) -> QPointF:
@@ -414,77 +680,223 @@ class BoxInfo:
 
 class DraggableText(QGraphicsProxyWidget, BoxInfo):
     # it has position related functions
-    def __init__(self, box_info, nvim, buffer_handle, filename, view, all_parents):
+
+    def __init__(
+        self,
+        box_info,
+        buffer_handle,
+        filename,
+        view,
+        scene_graph,
+        init_folds=None,
+        init_sign_lines=None,
+    ):
         QGraphicsProxyWidget.__init__(self)
         BoxInfo.__init__(self, **box_info.__dict__)
+        # cached result of get_plane_scale, None when it needs recomputing
+        # (whatever changes its inputs calls invalidate_plane_scale)
+        self._plane_scale = None
 
         # note that num doesn't need to be the same as buffer_handle.number
         self.buffer = buffer_handle
         self.filename = filename
         self.view = view
-        self.all_parents = all_parents
+        self.scene_graph = scene_graph
         self.setScale(self.manual_scale)
         self._pin_pos = None
         self.folds = []
         self.sign_lines = []
-        self._height = 0
-
-        # optionally, send some input on creation
-        if is_buf_empty(self.buffer) and self.filename is not None:
-            if self.filename.endswith(".md") and Config.input_on_creation:
-                nvim.command("startinsert")
-                nvim.input(Config.input_on_creation)
-            elif self.filename.endswith(".aichat") and Config.input_on_creation_aichat:
-                assert Path.cwd() == self.view.workspace_dir
-                file_pattern = "./**/*.md"
-                nvim.command("startinsert")
-                nvim.input(Config.input_on_creation_aichat.format(files_to_include=file_pattern))
-                # move to the second line, not changing the mode
-                nvim.current.window.cursor = [2, 0]
-        if filename is not None:
+        self._height = self.cached_height
+        self.insides_renderer = None
+        self.label_overlay = LabelOverlay(self)
+        # small picture of the box, drawn instead of it when it's tiny on screen
+        self._thumbnail = None
+        # layout revision of the renderer when the height was last measured
+        self._measured_revision = None
+        # whether its height wasn't measured since it could have changed
+        self._height_stale = False
+        # the plane pos and scale of its last layout, see _needs_layout
+        self._laid_out = None
+        # the extmarks the labels were last drawn from
+        self._label_extmarks = []
+        # whether the box info changed since it was last saved
+        self.dirty = False
+
+        if filename is None:
+            self.hue = Config.non_persistent_hue
+        else:
             savedir = Path(filename).parent
-        assert self.buffer == nvim.current.buffer
+            self.hue = self.view.buf_handler.savedir_hues[savedir]
 
+        if buffer_handle is None:
+            # dormant text - it has no nvim buffer yet, only its geometry,
+            # and it is drawn as a placeholder until it's materialized
+            self.resize(Config.text_width, self._height)
+            return
+
+        # (the folds and signs are fetched together with the buffer, see BufferHandler)
+        self.materialize(buffer_handle, init_folds or [], init_sign_lines or [])
+
+    def mark_dirty(self):
+        # call it after changing any of the saved BoxInfo fields
+        self.dirty = True
+        self.view.buf_handler.record_change(self)
+
+    def is_materialized(self):
+        return self.insides_renderer is not None
+
+    def materialize(self, buffer_handle, init_folds, init_sign_lines):
+        # bind to a live nvim buffer and create the widget displaying it
+        self.buffer = buffer_handle
         self.insides_renderer = TextboxInsidesRenderer(
-            hue=(
-                Config.non_persistent_hue
-                if filename is None
-                else self.view.buf_handler.savedir_hues[savedir]
-            ),
-            brightness_multiplier=0.5 if filename is None else 1,
-            # get folds and signs for potential future drawing
-            init_folds=nvim.eval("GetAllFolds()"),
-            init_signs=nvim.eval("sign_getplaced()"),
+            hue=self.hue,
+            brightness_multiplier=0.5 if self.filename is None else 1,
+            init_folds=init_folds,
+            init_sign_lines=init_sign_lines,
+            outline=True,
+            backend=Config.box_backend,
         )
-        self.setWidget(self.insides_renderer.text_box)
+        self._measured_revision = None
+        text_box = self.insides_renderer.text_box
+        if Config.box_backend == "painter":
+            # no widget, the document is painted in self.paint
+            text_box.item = self
+            text_box.document().contentsChanged.connect(self.update)
+            self.resize(Config.text_width, self._height)
+        else:
+            self.setWidget(text_box)
+        text_box.document().contentsChanged.connect(self._invalidate_thumbnail)
+        self.insides_renderer.on_style_changed = self._on_style_changed
+
+    def _invalidate_thumbnail(self):
+        self._thumbnail = None
+
+    def _on_style_changed(self):
+        # the thumbnail shows the old colors
+        self._invalidate_thumbnail()
+        self.update()
+
+    def render_thumbnail(self):
+        # outside of painting, see paint
+        if not self.is_materialized() or self._thumbnail is not None:
+            return
+        self._thumbnail = self.insides_renderer.text_box.grab().scaledToHeight(
+            Config.lod_thumbnail_height, Qt.SmoothTransformation
+        )
+        self.update()
+
+    def update_labels(self, extmarks, text_changed=False):
+        # returns early if they didn't change, which is the case for most texts during a hop
+        # (but if the text was re-rendered, the labels may need to move)
+        if extmarks == self._label_extmarks and not text_changed:
+            return
+        self._label_extmarks = extmarks
+        self.label_overlay.set_labels(self.insides_renderer, _get_labels(extmarks))
+
+    def release(self):
+        # drop the widget (the buffer is wiped by the caller), keeping only geometry
+        self.update_labels([])
+        self._invalidate_thumbnail()
+        text_box = self.insides_renderer.text_box
+        if Config.box_backend == "painter":
+            text_box.item = None
+        else:
+            self.setWidget(None)
+            text_box.deleteLater()
+        self.insides_renderer = None
+        self.buffer = None
+        self.resize(Config.text_width, self._height)
+
+    def paint(self, painter, option, widget=None):
+        if self._height_stale:
+            # it came into view, so measure it (but not during painting)
+            self._height_stale = False
+            self.view.buf_handler.remeasure_later(self)
+
+        color = QColor.fromHslF(self.hue / 360, 0.96, Config.border_brightness)
+        if not self.is_materialized():
+            # placeholder for a dormant text
+            painter.setPen(color)
+            painter.drawRect(self.rect())
+            return
+
+        # level of detail: tiny boxes aren't readable anyway, so don't paint the whole widget
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        screen_height = self.rect().height() * lod
+        if screen_height >= Config.lod_thumbnail_height:
+            if Config.box_backend == "painter":
+                self.insides_renderer.text_box.paint(painter, self.rect())
+            else:
+                super().paint(painter, option, widget)
+        elif screen_height >= Config.lod_block_height:
+            if self._thumbnail is None:
+                # (it's only regrabbed after the text, its size or its colors change)
+                # grabbing renders the widget, so it's done after the paint, and until
+                # then the box is drawn as a block
+                self.view.buf_handler.render_thumbnail_later(self)
+                painter.fillRect(self.rect(), color)
+                return
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            painter.drawPixmap(self.rect(), self._thumbnail, QRectF(self._thumbnail.rect()))
+        else:
+            painter.fillRect(self.rect(), color)
 
     def __hash__(self) -> int:
         # use QGraphicProxyWidget's hash
         return QGraphicsProxyWidget.__hash__(self)
 
+    def mousePressEvent(self, event):
+        if Config.box_backend == "painter" and self.is_materialized():
+            # there's no widget to place the cursor, so do it here
+            # (and accept, to get the move events for dragging)
+            self.insides_renderer.text_box.set_cursor_at(event.pos())
+            event.accept()
+            return
+        super().mousePressEvent(event)
+
     def mouseMoveEvent(self, event):
         # drag around
-        mouse_end = QPointF(event.screenPos() / self.view.global_scale)
+        mouse_end = event.scenePos()
         displacement = self.get_plane_scale() * self._pin_pos
         target_pos = mouse_end - displacement
-        if self.parent_filename is None:
+        parent = self.scene_graph.get_parent(self)
+        if parent is None:
             self.plane_pos_vect = target_pos
+            if Config.autoshrink:
+                # its scale depends on its position
+                self.invalidate_plane_scale()
+            self.mark_dirty()
             self.reposition()
         else:
             # this is a child
-            parent = self.all_parents[self]
             parent_pos = parent.plane_pos_vect
             parent_scale = parent.get_plane_scale()
             self.pos_rel_to_parent_vect = (target_pos - parent_pos) / parent_scale
+            self.mark_dirty()
             parent.reposition()
         
         if Config.vim_mode:
             self.view.dummy.setFocus()
 
+    def invalidate_plane_scale(self):
+        # push the invalidation down the subtree
+        # (a box can only have its scale cached if its parent has, so cleared subtrees are skipped)
+        to_invalidate = [self]
+        while to_invalidate:
+            text = to_invalidate.pop()
+            if text._plane_scale is None:
+                continue
+            text._plane_scale = None
+            to_invalidate.extend(text.scene_graph.get_children(text))
+
     def get_plane_scale(self):
-        if self.parent_filename is not None:
-            parent = self.all_parents[self]
-            # todo the fact that it's recomputed may be inefficient for large trees
+        if self._plane_scale is None:
+            self._plane_scale = self._calculate_plane_scale()
+        return self._plane_scale
+
+    def _calculate_plane_scale(self):
+        parent = self.scene_graph.get_parent(self)
+        if parent is not None:
             return parent.get_plane_scale() * self.scale_rel_to_parent
         elif Config.autoshrink:
             # euclidean magniture of plane_pos
@@ -495,35 +907,70 @@ class DraggableText(QGraphicsProxyWidget, BoxInfo):
         else:
             return self.manual_scale
 
-    def reposition(self):
-        global_scale = self.view.global_scale
-        self.setScale(self.get_plane_scale() * global_scale)
-        self.setPos(self.plane_pos_vect * global_scale)
-
-        # set height
-        # for some reason it needs to be done twice, to prevent a glitch
-        # only the smaller of those two heights is valid
-        height = self._calculate_height()
-        self.insides_renderer.text_box.setFixedHeight(height)
-        height = min(self._calculate_height(), height)
-        self.insides_renderer.text_box.setFixedHeight(height)
-        self._height = height
-
-        # place children
-        children = self.all_parents.inverted().getlist(self)
+    def reposition(self, cull_rect=None):
+        # items are in plane coords - the zoom is applied by the view transform,
+        # so this is only needed when the geometry of this box or its parent changes
+        self.setScale(self.get_plane_scale())
+        self.setPos(self.plane_pos_vect)
+        self._laid_out = (self.plane_pos, self.get_plane_scale())
+
+        # the height is measured only if the displayed content changed since the last
+        # measurement, and only for the boxes near the view - the rest keep their last
+        # height and get measured when they are painted (see paint)
+        if cull_rect is None:
+            cull_rect = self.view.get_cull_rect()
+        if self._needs_measuring() and self.get_plane_rect().intersects(cull_rect):
+            self._measure_height()
+        self._height_stale = self._needs_measuring()
+        self.view.buf_handler.spatial_index.update(self, self.get_plane_rect().getCoords())
+
+        # place children (the ones whose subtrees didn't change are skipped)
+        children = self.scene_graph.get_children(self)
         width = self.get_plane_width()
         gap = Config.text_gap * self.get_plane_scale() / self.manual_scale
         height_acc = 0
         for child in children:
             if child.pos_rel_to_parent is None:
                 child.plane_pos_vect = self.plane_pos_vect + QPointF(width + gap, height_acc)
-                child.reposition()
-                height_acc += child.get_plane_height() + gap
             else:
                 child.plane_pos_vect = (
                     self.plane_pos_vect + child.pos_rel_to_parent_vect * self.get_plane_scale()
                 )
-                child.reposition()
+            if child._needs_layout(cull_rect):
+                child.reposition(cull_rect)
+            if child.pos_rel_to_parent is None:
+                height_acc += child.get_plane_height() + gap
+
+    def _needs_layout(self, cull_rect):
+        # if its pos and scale are the same as in its last layout, and it has nothing
+        # to measure, its whole subtree keeps its layout - a descendant whose height
+        # can change gets its own parent repositioned (see BufferHandler.reposition_texts)
+        if self._laid_out != (self.plane_pos, self.get_plane_scale()):
+            return True
+        return self._needs_measuring() and self.get_plane_rect().intersects(cull_rect)
+
+    def _needs_measuring(self):
+        return (
+            self.is_materialized()
+            and self._measured_revision != self.insides_renderer.layout_revision
+        )
+
+    def _measure_height(self):
+        # for some reason it needs to be done twice, to prevent a glitch
+        # only the smaller of those two heights is valid
+        height = self._calculate_height()
+        self.insides_renderer.text_box.setFixedHeight(height)
+        height = min(self._calculate_height(), height)
+        self.insides_renderer.text_box.setFixedHeight(height)
+        self._measured_revision = self.insides_renderer.layout_revision
+        if Config.box_backend == "painter":
+            self.resize(Config.text_width, height)
+        if height != self._height:
+            self._invalidate_thumbnail()
+        self._height = height
+        if height != self.cached_height:
+            self.cached_height = height
+            self.mark_dirty()
 
     def _calculate_height(self):
         height = self.insides_renderer.text_box.document().size().height() + 2
@@ -537,39 +984,19 @@ class DraggableText(QGraphicsProxyWidget, BoxInfo):
         # this needs to be called after this node's reposition
         return self.get_plane_scale() * self._height
 
-    def get_center(self):
-        # note: it's in screen coords, not plane coords
-        return self.mapToScene(self.rect().center())
+    def get_plane_rect(self):
+        # computed from the plane geometry, so it's valid also before reposition
+        x, y = self.plane_pos
+        return QRectF(x, y, self.get_plane_width(), self.get_plane_height())
 
     def get_rel_filename(self):
         if self.filename is None:
             return None
         return Path(self.filename).relative_to(self.view.workspace_dir).as_posix()
 
-    def save_text_buffer(self, nvim):
-        # take the actual filename from the buffer
-        buf_filename = self.buffer.name
-        buf_filename = Path(buf_filename).resolve().as_posix()
-        # make sure the actual filename is the same as given one
-        assert buf_filename == self.filename, (buf_filename, self.filename)
-
-        # set this buffer as current
-        nvim.api.set_current_buf(self.buffer.number)
-        # save it
-        nvim.command("w")
-
-    def persist_info(self):
+    def get_info(self):
         # put in info all the BoxInfo fields (look at BoxInfo class attributes)
-        info = {k: self.__dict__[k] for k in BoxInfo.__annotations__}
-        filepath = Path(self.filename).resolve()
-        info_path = filepath.parent / "boxinfo" / f"{filepath.stem}.json"
-        info_path.write_text(json.dumps(info, indent=4))
-
-    def load_info(self):
-        filepath = Path(self.filename).resolve()
-        info_path = filepath.parent / "boxinfo" / f"{filepath.stem}.json"
-        info = json.loads(info_path.read_text())
-        self.__dict__.update(info)
+        return {k: self.__dict__[k] for k in BoxInfo.__annotations__}
 
 
 class EditorBox(QGraphicsProxyWidget):
@@ -596,11 +1023,12 @@ class EditorBox(QGraphicsProxyWidget):
             }}
         """
 
+        # get folds and signs for potential future drawing
+        buf_info = nvim.exec_lua("return infinote_buf_info()")
         self.insides_renderer = TextboxInsidesRenderer(
             hue=hue,
-            # get folds and signs for potential future drawing
-            init_folds=nvim.eval("GetAllFolds()"),
-            init_signs=nvim.eval("sign_getplaced()"),
+            init_folds=buf_info["folds"],
+            init_sign_lines=buf_info["sign_lines"],
             style=style,
             set_width=False,
         )
@@ -620,6 +1048,9 @@ class EditorBox(QGraphicsProxyWidget):
             x * Config.editor_width_ratio - margin - 2,
             y - 2 * margin - 2,
         )
+        # it's not zoomed with the plane, so the view positions it (see GraphicView.global_scale)
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self.screen_pos = self.pos()
 
         # make sure it is on top
         self.setZValue(1)
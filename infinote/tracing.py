@@ -0,0 +1,120 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+from infinote.config import Config
+
+# latency metrics, measured from an input to the paint which shows its effect
+KEY_TO_PAINT = "key to paint"
+ZOOM_FRAME = "zoom frame"
+
+
+def _percentile(sorted_values, fraction):
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Tracer:
+    # collects timed spans (see traced) into a ring buffer, exportable as a Chrome trace
+    # (which can be opened in chrome://tracing or ui.perfetto.dev), and latencies
+    # from inputs to the paints showing them
+    #
+    # everything here is a no-op unless Config.tracing is set
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, start, end, thread id), times in seconds from perf_counter
+        self._spans = deque(maxlen=Config.trace_buffer_size)
+        self._latencies = defaultdict(lambda: deque(maxlen=Config.trace_latency_samples))
+        # metric -> start times of the inputs which are drawn, but not painted yet
+        self._awaiting_paint = defaultdict(list)
+
+    def add_span(self, name, start, end):
+        with self._lock:
+            self._spans.append((name, start, end, threading.get_ident()))
+
+    def drawn(self, metric, start_times):
+        # the effects of these inputs are drawn, so the next paint will show them
+        if not Config.tracing:
+            return
+        self._awaiting_paint[metric].extend(start_times)
+
+    def painted(self):
+        if not Config.tracing:
+            return
+        now = time.perf_counter()
+        for metric, start_times in self._awaiting_paint.items():
+            self._latencies[metric].extend(now - start for start in start_times)
+            start_times.clear()
+
+    def get_latency_percentiles(self, metric):
+        # p50, p95 and p99 in seconds, over the recent samples, or None if there are none
+        values = sorted(self._latencies[metric])
+        if not values:
+            return None
+        return tuple(_percentile(values, fraction) for fraction in (0.5, 0.95, 0.99))
+
+    def get_span_percentiles(self):
+        # for each span name: p50, p95 and p99 of its durations in the ring buffer
+        durations = defaultdict(list)
+        with self._lock:
+            for name, start, end, _ in self._spans:
+                durations[name].append(end - start)
+        return {
+            name: tuple(_percentile(sorted(values), f) for f in (0.5, 0.95, 0.99))
+            for name, values in durations.items()
+        }
+
+    def get_overlay_text(self):
+        lines = []
+        for metric in (KEY_TO_PAINT, ZOOM_FRAME):
+            percentiles = self.get_latency_percentiles(metric)
+            if percentiles is not None:
+                lines.append(f"{metric}: " + _format_percentiles(percentiles))
+        span_percentiles = self.get_span_percentiles()
+        # the slowest first
+        for name in sorted(span_percentiles, key=lambda n: -span_percentiles[n][1]):
+            lines.append(f"  {name}: " + _format_percentiles(span_percentiles[name]))
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        with self._lock:
+            spans = list(self._spans)
+        pid = os.getpid()
+        events = [
+            dict(name=name, ph="X", ts=start * 1e6, dur=(end - start) * 1e6, pid=pid, tid=tid)
+            for name, start, end, tid in spans
+        ]
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": events}))
+        return path
+
+
+def _format_percentiles(percentiles):
+    p50, p95, p99 = (value * 1000 for value in percentiles)
+    return f"p50 {p50:.1f}ms  p95 {p95:.1f}ms  p99 {p99:.1f}ms"
+
+
+tracer = Tracer()
+
+
+def traced(function):
+    # records a span for each call of the decorated function
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not Config.tracing:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            tracer.add_span(name, start, time.perf_counter())
+
+    return wrapper
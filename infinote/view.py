@@ -1,19 +1,24 @@
 import time
 
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QColor, QPainter
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QColor, QPainter, QTransform
 from PySide6.QtWidgets import (
     QGraphicsItem,
     QGraphicsRectItem,
     QGraphicsScene,
     QGraphicsView,
+    QLabel,
     QStatusBar,
 )
 
 from infinote.buffer_handling import BufferHandler
 from infinote.config import Config
-from infinote.key_handler import KeyHandler
-from infinote.text_object import BoxInfo, DraggableText, EditorBox
+from infinote.key_handler import KeyHandler, parse_key_event_into_text
+from infinote.llm import LlmEngine
+from infinote.nvim_worker import NvimWorker
+from infinote.redraw_scheduler import RedrawScheduler
+from infinote.text_object import BoxInfo, DraggableText, EditorBox, LabelOverlay
+from infinote.tracing import KEY_TO_PAINT, ZOOM_FRAME, traced, tracer
 
 
 def _exit_visual_mode(nvim):
@@ -22,6 +27,15 @@ def _exit_visual_mode(nvim):
         nvim.input("<Esc>")
 
 
+def _select_in_vim(nvim, selection):
+    # select in nvim what's selected in qt, see pop_qt_selection
+    (y_start, x_start), (y_end, x_end) = selection
+    nvim.input("<Esc>")
+    nvim.api.win_set_cursor(0, (y_start, x_start))
+    nvim.input("v")
+    nvim.api.win_set_cursor(0, (y_end, x_end))
+
+
 class GraphicView(QGraphicsView):
     def __init__(self, nvim, main_subdir, parent=None):
         super().__init__(parent)
@@ -31,13 +45,19 @@ class GraphicView(QGraphicsView):
         self.setScene(QGraphicsScene())
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.global_scale = 1.0
+        # the plane origin is always at the top left corner of the view
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self._global_scale = 1.0
+        self.nvim_worker = NvimWorker(nvim)
+        self.llm_engine = LlmEngine(self)
         self.key_handler = KeyHandler(nvim, self)
         self.buf_handler = BufferHandler(nvim, self)
+        self.redraw_scheduler = RedrawScheduler(self)
         self.current_folder = main_subdir
         self.workspace_dir = main_subdir.parent
         self.timer = None
         self._timer_last_update = None
+        self.rpc_stats = None  # set by main, if Config.rpc_stats
 
         # dummy object so that the text boxes can be unfocused
         dummy = QGraphicsRectItem()
@@ -54,15 +74,67 @@ class GraphicView(QGraphicsView):
         color = Config.background_color
         self.status_bar.setStyleSheet("QStatusBar{background-color: " + color + ";}")
         self._message = []
-        self.scene().addWidget(self.status_bar)
+        status_bar_proxy = self.scene().addWidget(self.status_bar)
+        status_bar_proxy.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+
+        # latency percentiles, below the status bar (see toggle_debug_overlay)
+        self.debug_overlay = QLabel()
+        self.debug_overlay.setStyleSheet(
+            f"background-color: {Config.background_color}; color: white; font-family: monospace;"
+        )
+        self._debug_overlay_proxy = self.scene().addWidget(self.debug_overlay)
+        self._debug_overlay_proxy.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self._debug_overlay_proxy.setPos(0, 20)
+        self._debug_overlay_proxy.hide()
+        # refreshed periodically, because refreshing on paint would cause another paint
+        self._debug_overlay_timer = QTimer()
+        self._debug_overlay_timer.timeout.connect(self._refresh_debug_overlay)
 
         self.editor_box = EditorBox(nvim, self.nvim.current.buffer, self)
         self.scene().addItem(self.editor_box)
         self.show_editor = True
 
+    @property
+    def global_scale(self):
+        return self._global_scale
+
+    @global_scale.setter
+    def global_scale(self, value):
+        # zooming is a single view transform, anchored at the plane origin,
+        # so the texts keep their plane coords and don't need to be repositioned
+        self._global_scale = value
+        self.setTransform(QTransform.fromScale(value, value))
+        self._update_scene_rect()
+
+    def _update_scene_rect(self):
+        # the scene rect is the visible part of the plane
+        size = self.viewport().size()
+        scale = self._global_scale
+        self.scene().setSceneRect(0, 0, size.width() / scale, size.height() / scale)
+        # the editor ignores the transform, but its position is still in plane coords
+        self.editor_box.setPos(self.editor_box.screen_pos / scale)
+        self._debug_overlay_proxy.setPos(0, 20 / scale)
+
+    def toggle_debug_overlay(self):
+        if not Config.tracing:
+            self.msg("set Config.tracing to measure the latencies")
+            return
+        if self._debug_overlay_proxy.isVisible():
+            self._debug_overlay_timer.stop()
+            self._debug_overlay_proxy.hide()
+        else:
+            self._refresh_debug_overlay()
+            self._debug_overlay_proxy.show()
+            self._debug_overlay_timer.start(250)
+
+    def _refresh_debug_overlay(self):
+        self.debug_overlay.setText(tracer.get_overlay_text() or "no samples yet")
+        self.debug_overlay.adjustSize()
+
     def _render_status_bar(self):
-        mode_dict = self.nvim.api.get_mode()
-        if not mode_dict["blocking"]:
+        # uses the nvim state from the last redraw, so it doesn't need to call nvim
+        mode_dict = self.buf_handler.mode_info
+        if mode_dict is not None and not mode_dict["blocking"]:
             num_unbound_bufs = self.buf_handler.get_num_unbound_buffers()
             if num_unbound_bufs > 0:
                 self.msg(f"{num_unbound_bufs} unbound buffer exists - click somewhere to place it")
@@ -77,74 +149,149 @@ class GraphicView(QGraphicsView):
         if command_line:
             self._message = [command_line] + self._message
 
-        msg_string = " | ".join(self._message)
+        messages = self._message
+        if self.rpc_stats is not None:
+            # (not kept in self._message, it's replaced on each render)
+            rpc_message = self.rpc_stats.get_status_message()
+            if rpc_message is not None:
+                messages = messages + [rpc_message]
+
+        msg_string = " | ".join(messages)
         self.status_bar.showMessage(msg_string)
 
     # event handling methods
     # note: there's one more possible event: mouseMoveEvent, but it's handled by texts
 
     def resizeEvent(self, event):
-        self.scene().setSceneRect(0, 0, event.size().width(), event.size().height())
         super().resizeEvent(event)
+        self._update_scene_rect()
 
     def mousePressEvent(self, event):
         # ignore non-left clicks
         if event.button() != Qt.LeftButton:
             return
         self._message = []
-        item = self.scene().itemAt(event.screenPos(), self.transform())
+        # the nvim calls of the click go after the keys pressed before it
+        self.redraw_scheduler.send_pending_keys()
+        self._handle_click(event)
+        self._render_status_bar()
+
+    def _handle_click(self, event):
+        # the click is handled by Qt right away, and its nvim calls are submitted
+        # to the nvim worker, so a busy nvim doesn't freeze the GUI
+        item = self.itemAt(event.position().toPoint())
+        if isinstance(item, LabelOverlay):
+            # clicked on a label, so on the text below it
+            item = item.parentItem()
 
         if isinstance(item, DraggableText):
             # clicked on text, so make it current
-            self.buf_handler.jump_to_buffer(item.buffer.number)
-            self.buf_handler.update_all_texts()
 
             # pin the click position, in case of dragging
-            click_pos = event.screenPos() / self.global_scale
+            click_pos = self.mapToScene(event.position().toPoint())
             item._pin_pos = (click_pos - item.plane_pos_vect) / item.get_plane_scale()
-            
+
             # we need to first process the click by the widget to set cursor in it
             # we also need to pass the event, in case it's a drag event
             super().mousePressEvent(event)
-            item.insides_renderer.sync_qt_cursor_into_vim(self.nvim)
-            # note: maybe that makes dragging less efficient, but we need to do it to set the cursor
-            self.buf_handler.update_all_texts()
+
+            def on_drawn():
+                self._focus_after_click(item)
+
+            if item.is_materialized():
+                cursor_pos = item.insides_renderer.get_qt_cursor_pos()
+                self._jump_to_text(item, cursor_pos, on_drawn)
+            else:
+                # a placeholder, so its file needs to be opened first
+                self.buf_handler.materialize_texts(
+                    [item], on_done=lambda _: self._jump_to_text(item, on_drawn=on_drawn)
+                )
 
         elif isinstance(item, EditorBox):
-            _exit_visual_mode(self.nvim)
             # we need to first process the click by the widget to set cursor in it
             super().mousePressEvent(event)
-            item.insides_renderer.sync_qt_cursor_into_vim(self.nvim)
-            self.buf_handler.update_all_texts()
+            cursor_pos = item.insides_renderer.get_qt_cursor_pos()
+
+            def job():
+                _exit_visual_mode(self.nvim)
+                self.nvim.api.win_set_cursor(0, cursor_pos)
+
+            self.nvim_worker.submit(job)
+            self.buf_handler.update_all_texts(on_drawn=lambda: self._focus_after_click(item))
         else:
             # clicked bg, so create a new text
-            item = self.buf_handler.create_text(
+            self.buf_handler.create_text(
                 self.current_folder,
-                BoxInfo(plane_pos=(event.screenPos() / self.global_scale).toTuple()),
+                BoxInfo(plane_pos=self.mapToScene(event.position().toPoint()).toTuple()),
+                on_created=self._focus_after_click,
             )
-            self.buf_handler.update_all_texts()
             # super().mousePressEvent(event)
 
+    def _focus_after_click(self, item):
         if self.show_editor:
             self.editor_box.setFocus()
         else:
             item.setFocus()
-        self._render_status_bar()
 
+    def _jump_to_text(self, text, cursor_pos=None, on_drawn=None):
+        # make it the current text, optionally also moving the nvim cursor, and redraw
+        buf_num = text.buffer.number
+
+        def job():
+            self.buf_handler.jump_to_buffer(buf_num)
+            if cursor_pos is not None:
+                self.nvim.api.win_set_cursor(0, cursor_pos)
+
+        self.nvim_worker.submit(job)
+        self.buf_handler.update_all_texts(on_drawn)
+
+    @traced
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        # the drawn inputs are on screen now
+        tracer.painted()
+
+    @traced
     def keyPressEvent(self, event):
+        press_time = time.perf_counter()
         self._message = []
+        text = parse_key_event_into_text(event)
+
+        # the key acts on what was selected in the editor with the mouse
+        # (it's cleared in qt, so that the next keys don't select it again)
+        selection = self.editor_box.insides_renderer.pop_qt_selection()
+        if selection is not None:
+            self.redraw_scheduler.send_pending_keys()
+            self.nvim_worker.submit(lambda: _select_in_vim(self.nvim, selection))
+
+        if text in Config.keys:
+            # custom commands touch the scene, so they run here, in the GUI thread
+            # (their nvim calls go to the nvim worker, after the keys pressed before)
+            self.redraw_scheduler.send_pending_keys()
+            # (if the command redraws the texts, the key is drawn when that redraw is)
+            self.buf_handler.undrawn_key_times.append(press_time)
+            self.key_handler.handle_custom_command(text)
+            self._render_status_bar()
+            if self.buf_handler.undrawn_key_times:
+                # it didn't, so its effects are drawn already
+                tracer.drawn(KEY_TO_PAINT, self.buf_handler.undrawn_key_times)
+                self.buf_handler.undrawn_key_times = []
+            return
 
-        self.editor_box.insides_renderer.if_qt_selection_sync_into_vim(self.nvim)
+        if text is None:
+            return
 
-        self.key_handler.handle_key_event(event)
-        self.buf_handler.update_all_texts()
-        self._render_status_bar()
+        # normal keys are sent, and the new state fetched, in the nvim worker thread
+        # so the GUI stays responsive even if nvim is busy
+        # (the scheduler batches them, and draws at most once per frame)
+        self.redraw_scheduler.add_key(text, event.text())
 
     def wheelEvent(self, event):
+        event_time = time.perf_counter()
         direction = -1 if Config.scroll_invert else 1
         zoom_factor = Config.scroll_speed ** (event.angleDelta().y() * direction)
 
-        item = self.scene().itemAt(event.position(), self.transform())
+        item = self.itemAt(event.position().toPoint())
         if isinstance(item, EditorBox):
             # handle text scroll normally
             super().wheelEvent(event)
@@ -155,10 +302,21 @@ class GraphicView(QGraphicsView):
         else:
             # zoom the whole view
             self.global_scale *= zoom_factor
+            self._on_view_moved()
+            tracer.drawn(ZOOM_FRAME, [event_time])
 
-            # reposition all texts
-            for text in self.buf_handler.get_root_texts():
-                text.reposition()
+    def _on_view_moved(self):
+        # texts don't need repositioning, the view transform already changed
+        if Config.lazy_materialization and self.buf_handler.get_texts_to_materialize():
+            # some placeholders came into view, so load and draw them
+            self.buf_handler.update_all_texts()
+
+    def get_cull_rect(self):
+        # boxes outside of it are not measured, see DraggableText.reposition
+        # (it's in plane coords, like the scene rect)
+        view_rect = self.sceneRect()
+        margin = view_rect.width() * Config.cull_margin
+        return view_rect.adjusted(-margin, -margin, margin, margin)
 
     def msg(self, msg):
         self._message.append(msg)
@@ -169,8 +327,11 @@ class GraphicView(QGraphicsView):
         if new is None:
             return
 
-        buf_num = new.buffer.number
-        self.buf_handler.jump_to_buffer(buf_num)
+        if new.is_materialized():
+            self._jump_to_text(new)
+        else:
+            # a placeholder, so its file needs to be opened first
+            self.buf_handler.materialize_texts([new], on_done=lambda _: self._jump_to_text(new))
 
         if Config.track_jumps_on_neighbor_moves:
             self.track_jump(current_text, new)
@@ -237,13 +398,12 @@ class GraphicView(QGraphicsView):
         time_diff = new_time - self._timer_last_update
         self._timer_last_update = new_time
 
+        event_time = time.perf_counter()
         self.global_scale *= Config.key_zoom_speed ** (time_diff * sign)
+        self._on_view_moved()
+        tracer.drawn(ZOOM_FRAME, [event_time])
 
-        # reposition all texts
-        for text in self.buf_handler.get_root_texts():
-            text.reposition()
-
-    def resize(self, sign):
+    def scale_current_text(self, sign):
         if self._timer_last_update is None:
             # timer just starting
             self._timer_last_update = time.time()
@@ -255,33 +415,18 @@ class GraphicView(QGraphicsView):
         # resize current text box
         text = self.buf_handler.get_current_text()
         delta = Config.key_zoom_speed ** (time_diff * sign)
-        if text.parent_filename is None:
+        if self.buf_handler.scene_graph.get_parent(text) is None:
             text.manual_scale *= delta
         else:
             text.scale_rel_to_parent *= delta
-        text.reposition()
+        text.invalidate_plane_scale()
+        text.mark_dirty()
+        # (its later siblings move too)
+        self.buf_handler.reposition_texts([text])
 
     def _get_closest_text(self, current_text, direction):
-        current_center = current_text.get_center()
-
-        # get all texts in that direction
-        candidate_text_distances = dict()
-        for text in self.buf_handler.get_texts():
-            if text == current_text:
-                continue
-            diff = text.get_center() - current_center
-            x, y = diff.x(), diff.y()
-
-            if (
-                (direction == "down" and y >= abs(x))
-                or (direction == "right" and x >= abs(y))
-                or (direction == "up" and y <= -abs(x))
-                or (direction == "left" and x <= -abs(y))
-            ):
-                candidate_text_distances[text] = (x**2 + y**2) ** 0.5
-
-        if len(candidate_text_distances) == 0:
-            return None
-
-        # get the closest one
-        return min(candidate_text_distances.keys(), key=candidate_text_distances.get)
+        # the closest one in that direction, comparing the centers
+        # (distances in plane coords have the same order as on the screen)
+        current_center = current_text.get_plane_rect().center().toTuple()
+        spatial_index = self.buf_handler.spatial_index
+        return spatial_index.nearest_in_direction(current_center, direction, exclude=current_text)
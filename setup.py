@@ -7,13 +7,12 @@ setup(
     description="Feel the spatial freedom in your notes.",
     long_description_content_type="text/markdown",
     url="https://github.com/filyp/infinote",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     include_package_data=True,
     install_requires=[
         "PySide6",
         "pynvim",
         "colormath",
-        "boltons",
     ],
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -22,7 +21,7 @@ setup(
         "Operating System :: OS Independent",
     ],
     package_data={
-        "infinote": ["required.vim"],
+        "infinote": ["required.vim", "infinote.lua"],
     },
     python_requires=">=3.10",
     entry_points={
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from infinote.box_index import INDEX_FILENAME, BoxIndex, migrate_from_json
+from infinote.config import Config
+from infinote.text_object import BoxInfo
+
+
+@pytest.fixture
+def box_index(tmp_path):
+    index = BoxIndex(tmp_path / INDEX_FILENAME)
+    yield index
+    index.close()
+
+
+def _write_old_workspace(workspace_dir, infos):
+    # the old format: meta.json and a boxinfo/<num>.json file for each note
+    (workspace_dir / "meta.json").write_text(
+        json.dumps({"notes": {"hue": 120}, "active_text": "notes/0.md"})
+    )
+    group_dir = workspace_dir / "notes"
+    (group_dir / "boxinfo").mkdir(parents=True)
+    for num, info in infos.items():
+        (group_dir / f"{num}.md").write_text("- note\n")
+        if info is not None:
+            (group_dir / "boxinfo" / f"{num}.json").write_text(json.dumps(info))
+
+
+def test_migrate_boxinfo_without_cached_height(tmp_path, box_index):
+    # cached_height was added later, so the old box infos don't have it
+    old_info = dict(
+        plane_pos=[10, 20],
+        manual_scale=0.5,
+        scale_rel_to_parent=0.7,
+        pos_rel_to_parent=None,
+        parent_filename=None,
+    )
+    child_info = dict(old_info, parent_filename="notes/0.md", pos_rel_to_parent=[1, 2])
+    _write_old_workspace(tmp_path, {0: old_info, 1: child_info, 2: None})
+
+    migrate_from_json(box_index, tmp_path)
+    boxes = box_index.load_boxes()
+
+    # a note without a box info isn't imported
+    assert set(boxes) == {"notes/0.md", "notes/1.md"}
+    assert boxes["notes/0.md"].cached_height == Config.text_max_height
+    assert boxes["notes/0.md"].manual_scale == 0.5
+    assert boxes["notes/1.md"].parent_filename == "notes/0.md"
+    assert box_index.load_hues() == {"notes": 120}
+    assert box_index.get_meta("active_text") == "notes/0.md"
+
+
+def test_unknown_fields_are_ignored(box_index):
+    box_index.save({"a.md": dict(manual_scale=2, removed_field=1)}, {}, {})
+    assert box_index.load_boxes() == {"a.md": BoxInfo(manual_scale=2)}
+
+
+def test_save_updates_and_deletes(box_index):
+    box_index.save({"a.md": dict(manual_scale=2), "b.md": {}}, {"g": 1}, {})
+    box_index.save({"a.md": dict(manual_scale=3)}, {"g": 2}, {}, deleted=["b.md"])
+    assert box_index.load_boxes() == {"a.md": BoxInfo(manual_scale=3)}
+    assert box_index.load_hues() == {"g": 2}
+    assert box_index.get_meta("missing", "default") == "default"
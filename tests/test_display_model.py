@@ -0,0 +1,71 @@
+from infinote.display_model import FOLD_MARKER, DisplayModel
+
+# (folds and sign lines are 1-based, everything else 0-based)
+
+
+def test_nothing_hidden():
+    model = DisplayModel(["a", "b", "c"])
+    assert model.shown == [0, 1, 2]
+    assert [model.to_row(i) for i in range(3)] == [0, 1, 2]
+    assert [model.representative(i) for i in range(3)] == [0, 1, 2]
+    assert [model.to_line(row) for row in range(3)] == [0, 1, 2]
+
+
+def test_empty_model():
+    model = DisplayModel([])
+    assert model.displayed_lines == []
+    assert model.shown == []
+    # there is nothing to stand for it, so the line stands for itself
+    assert model.representative(0) == 0
+
+
+def test_fold():
+    model = DisplayModel(["a", "b", "c", "d"], folds=[[2, 3]])
+    assert model.displayed_lines == ["a", "b" + FOLD_MARKER, "c", "d"]
+    assert model.visible == [True, True, False, True]
+    assert [model.to_row(i) for i in range(4)] == [0, 1, 1, 2]
+    assert [model.representative(i) for i in range(4)] == [0, 1, 1, 3]
+    assert model.to_line(2) == 3
+
+
+def test_last_line_hidden():
+    model = DisplayModel(["a", "b", "c"], folds=[[2, 3]])
+    assert model.visible == [True, True, False]
+    assert model.to_row(2) == 1
+    assert model.representative(2) == 1
+
+
+def test_fold_past_the_end():
+    # folds can be out of date, f.e. after lines were deleted
+    model = DisplayModel(["a", "b", "c"], folds=[[2, 10], [5, 6]])
+    assert model.displayed_lines == ["a", "b" + FOLD_MARKER, "c"]
+    assert model.visible == [True, True, False]
+    assert model.representative(2) == 1
+    # lines which aren't in the model stand for themselves
+    assert model.representative(7) == 7
+
+
+def test_all_hidden():
+    model = DisplayModel(["  a", "  b"], outline=True)
+    assert model.visible == [False, False]
+    assert model.shown == []
+    assert [model.to_row(i) for i in range(2)] == [0, 0]
+    assert [model.representative(i) for i in range(2)] == [0, 1]
+
+
+def test_hidden_before_first_shown():
+    # there is no shown line above them, so the first shown one stands for them
+    model = DisplayModel(["  a", "  b", "c"], outline=True)
+    assert model.shown == [2]
+    assert [model.to_row(i) for i in range(3)] == [0, 0, 0]
+    assert [model.representative(i) for i in range(3)] == [2, 2, 2]
+
+
+def test_outline():
+    lines = ["- a", "  hidden", "  bookmarked", "", "- b"]
+    model = DisplayModel(lines, sign_lines={3}, outline=True)
+    assert model.visible == [True, False, True, True, True]
+    # expandable lines are marked
+    assert model.displayed_lines == ["+ a"] + lines[1:]
+    assert model.representative(1) == 0
+    assert [model.to_row(i) for i in range(5)] == [0, 0, 1, 2, 3]
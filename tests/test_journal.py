@@ -0,0 +1,36 @@
+import json
+
+from infinote.journal import Journal, clear_journal, read_journal
+
+
+def test_replay_latest_records(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.record("a.md", dict(manual_scale=1))
+    journal.record("b.md", dict(manual_scale=1))
+    journal.record("a.md", dict(manual_scale=2))
+    journal.record("b.md", None)
+    journal.close()
+
+    # deleted boxes are replayed as None
+    assert read_journal(journal.journal_path) == {"a.md": dict(manual_scale=2), "b.md": None}
+
+
+def test_replay_truncated_last_record(tmp_path):
+    # a crash while writing the last record leaves it cut
+    journal_path = tmp_path / "journal.jsonl"
+    full = json.dumps(["a.md", dict(manual_scale=1)]) + "\n"
+    cut = json.dumps(["a.md", dict(manual_scale=2)])[:-5]
+    journal_path.write_text(full + cut)
+    assert read_journal(journal_path) == {"a.md": dict(manual_scale=1)}
+
+    # the next session's records start on a new line, so they aren't lost with it
+    journal = Journal(journal_path)
+    journal.record("b.md", dict(manual_scale=3))
+    journal.close()
+    assert read_journal(journal_path) == {
+        "a.md": dict(manual_scale=1),
+        "b.md": dict(manual_scale=3),
+    }
+
+    clear_journal(journal_path)
+    assert read_journal(journal_path) == {}
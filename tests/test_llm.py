@@ -0,0 +1,319 @@
+import json
+import threading
+import time
+import urllib.error
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from infinote.config import Config
+from infinote.llm import LlmEngine, _stream_tokens, parse_aichat
+
+
+def _sse_chunk(content):
+    return "data: " + json.dumps({"choices": [{"delta": {"content": content}}]}) + "\n\n"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # an OpenAI-like streaming endpoint, answering with server.respond(request body),
+    # which returns (status, list of raw pieces written one by one)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((dict(self.headers), body))
+        status, pieces = self.server.respond(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for piece in pieces:
+            self.wfile.write(piece.encode())
+            self.wfile.flush()
+            time.sleep(self.server.piece_delay)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def llm_server(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.piece_delay = 0
+    server.respond = lambda body: (200, [_sse_chunk("hi"), "data: [DONE]\n\n"])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(Config, "llm_api_url", f"http://127.0.0.1:{server.server_port}/chat")
+    monkeypatch.setattr(Config, "llm_token_path", (tmp_path / "missing.token").as_posix())
+    monkeypatch.setattr(Config, "llm_timeout", 5)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# parse_aichat
+
+
+def test_parse_aichat_sections():
+    lines = [
+        ">>> system",
+        "",
+        "be brief",
+        ">>> user",
+        "",
+        "hello",
+        "",
+        "<<< assistant",
+        "",
+        "hi there",
+        ">>> user",
+        "",
+        "bye",
+    ]
+    assert parse_aichat(lines) == [
+        dict(role="system", content="be brief"),
+        dict(role="user", content="hello"),
+        dict(role="assistant", content="hi there"),
+        dict(role="user", content="bye"),
+    ]
+
+
+def test_parse_aichat_text_before_first_header_is_users():
+    messages = parse_aichat(["  ", "what is it", ">>> user", "and this"])
+    assert messages == [
+        dict(role="user", content="what is it"),
+        dict(role="user", content="and this"),
+    ]
+
+
+def test_parse_aichat_skips_empty_sections():
+    assert parse_aichat([">>> user", "question", "<<< assistant", "", ">>> user", " "]) == [
+        dict(role="user", content="question")
+    ]
+
+
+def test_parse_aichat_include(monkeypatch, tmp_path):
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "1.md").write_text("first\n")
+    (tmp_path / "notes" / "2.md").write_text("second\n")
+    (tmp_path / "notes" / "3.txt").write_text("not included\n")
+    monkeypatch.chdir(tmp_path)
+
+    messages = parse_aichat([">>> include", "", "notes/*.md", ">>> user", "summarize"])
+    assert messages == [
+        dict(role="user", content="==> notes/1.md <==\nfirst\n\n\n==> notes/2.md <==\nsecond\n"),
+        dict(role="user", content="summarize"),
+    ]
+
+
+# _stream_tokens
+
+
+def test_stream_tokens(llm_server):
+    llm_server.respond = lambda body: (
+        200,
+        [
+            # the first chunk only has the role, and some lines aren't data
+            "data: " + json.dumps({"choices": [{"delta": {"role": "assistant"}}]}) + "\n\n",
+            ": keep-alive comment\n\n",
+            _sse_chunk("Hello"),
+            _sse_chunk(", world"),
+            "data: [DONE]\n\n",
+            # anything after [DONE] is ignored
+            _sse_chunk("ignored"),
+        ],
+    )
+    messages = [dict(role="user", content="hi")]
+    assert list(_stream_tokens(messages, threading.Event())) == ["Hello", ", world"]
+
+    headers, body = llm_server.requests[0]
+    assert body == dict(model=Config.llm_model, messages=messages, stream=True)
+    # the token file doesn't exist
+    assert "Authorization" not in headers
+
+
+def test_stream_tokens_split_chunks(llm_server):
+    # events split across writes, also in the middle of a line and of a multibyte char
+    first, second = _sse_chunk("zażółć"), _sse_chunk("!")
+    raw = first + second + "data: [DONE]\n\n"
+    llm_server.piece_delay = 0.01
+    llm_server.respond = lambda body: (200, [raw[:7], raw[7:20], raw[20:40], raw[40:]])
+    assert list(_stream_tokens([], threading.Event())) == ["zażółć", "!"]
+
+
+def test_stream_tokens_sends_token(llm_server, monkeypatch, tmp_path):
+    token_path = tmp_path / "openai.token"
+    token_path.write_text("secret\n")
+    monkeypatch.setattr(Config, "llm_token_path", token_path.as_posix())
+    list(_stream_tokens([], threading.Event()))
+    headers, _ = llm_server.requests[0]
+    assert headers["Authorization"] == "Bearer secret"
+
+
+def test_stream_tokens_http_error(llm_server):
+    llm_server.respond = lambda body: (500, ["server error"])
+    with pytest.raises(urllib.error.HTTPError) as error:
+        list(_stream_tokens([], threading.Event()))
+    assert error.value.code == 500
+
+
+def test_stream_tokens_cancelled_mid_stream(llm_server):
+    llm_server.piece_delay = 0.01
+    llm_server.respond = lambda body: (200, [_sse_chunk(str(i)) for i in range(50)])
+    cancelled = threading.Event()
+    tokens = []
+    for token in _stream_tokens([], cancelled):
+        tokens.append(token)
+        if len(tokens) == 2:
+            cancelled.set()
+    assert tokens == ["0", "1"]
+
+
+# LlmEngine
+
+
+class _FakeBuffer:
+    def __init__(self, number, lines):
+        self.number = number
+        self.lines = lines
+
+    def __getitem__(self, index):
+        return self.lines[index]
+
+
+class _FakeNvim:
+    # only knows how to run llm._append_text_lua
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.appends = []
+
+    def exec_lua(self, code, buf_num, text):
+        self.appends.append((buf_num, text))
+        lines = self.buffers[buf_num].lines
+        lines[-1:] = (lines[-1] + text).split("\n")
+        return list(lines)
+
+
+class _FakeWorker:
+    # runs the jobs right away, one at a time, like the nvim worker
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def submit(self, job, on_done=None):
+        future = Future()
+        with self._lock:
+            result = job()
+            if on_done is not None:
+                on_done(result)
+        future.set_result(result)
+        return future
+
+
+class _FakeBufHandler:
+    def __init__(self):
+        self.redrawn = []
+
+    def redraw_text(self, buf_num, lines):
+        self.redrawn.append((buf_num, lines))
+
+
+def _make_engine(buffers):
+    view = SimpleNamespace(
+        nvim=_FakeNvim({buffer.number: buffer for buffer in buffers}),
+        nvim_worker=_FakeWorker(),
+        buf_handler=_FakeBufHandler(),
+        msg=lambda msg: None,
+        _render_status_bar=lambda: None,
+    )
+    return LlmEngine(view), view
+
+
+def _wait_until_done(engine, timeout=5):
+    deadline = time.time() + timeout
+    while engine.get_running_buf_nums():
+        assert time.time() < deadline, "completion didn't finish"
+        time.sleep(0.01)
+
+
+def test_engine_completes_two_chats_at_once(llm_server, monkeypatch):
+    # each chat gets its answer, streamed slowly, so that both run at the same time
+    llm_server.piece_delay = 0.01
+    llm_server.respond = lambda body: (
+        200,
+        [_sse_chunk(word + " ") for word in body["messages"][-1]["content"].split()]
+        + ["data: [DONE]\n\n"],
+    )
+    # flush only at the end, so the tokens get batched into one append
+    monkeypatch.setattr(Config, "llm_flush_interval", 60)
+    buffers = [
+        _FakeBuffer(1, [">>> user", "", "one two three"]),
+        _FakeBuffer(2, [">>> user", "", "four five six"]),
+    ]
+    engine, view = _make_engine(buffers)
+    for buffer in buffers:
+        engine.toggle(SimpleNamespace(buffer=buffer, filename=f"{buffer.number}.aichat"))
+    assert engine.get_running_buf_nums() == {1, 2}
+    _wait_until_done(engine)
+
+    for buffer, answer in zip(buffers, ["one two three ", "four five six "]):
+        assert buffer.lines == [
+            ">>> user",
+            "",
+            "one two three" if buffer.number == 1 else "four five six",
+            "",
+            "<<< assistant",
+            "",
+            answer,
+            "",
+            ">>> user",
+            "",
+            "",
+        ]
+        # the header, the batched answer, and the next user header
+        appends = [text for buf_num, text in view.nvim.appends if buf_num == buffer.number]
+        assert appends == ["\n\n<<< assistant\n\n", answer, "\n\n>>> user\n\n"]
+        # each append redraws the box
+        redrawn = [lines for buf_num, lines in view.buf_handler.redrawn if buf_num == buffer.number]
+        assert len(redrawn) == 3 and redrawn[-1] == buffer.lines
+
+
+def test_engine_flushes_periodically(llm_server, monkeypatch):
+    llm_server.respond = lambda body: (200, [_sse_chunk(c) for c in "abc"])
+    monkeypatch.setattr(Config, "llm_flush_interval", -1)
+    buffer = _FakeBuffer(1, [">>> user", "q"])
+    engine, view = _make_engine([buffer])
+    engine.toggle(SimpleNamespace(buffer=buffer, filename="1.aichat"))
+    _wait_until_done(engine)
+    appends = [appended for _, appended in view.nvim.appends]
+    assert appends == ["\n\n<<< assistant\n\n", "a", "b", "c", "\n\n>>> user\n\n"]
+
+
+def test_engine_toggle_cancels(llm_server, monkeypatch):
+    llm_server.piece_delay = 0.02
+    llm_server.respond = lambda body: (200, [_sse_chunk(str(i)) for i in range(100)])
+    monkeypatch.setattr(Config, "llm_flush_interval", -1)
+    buffer = _FakeBuffer(1, [">>> user", "q"])
+    engine, view = _make_engine([buffer])
+    text = SimpleNamespace(buffer=buffer, filename="1.aichat")
+    engine.toggle(text)
+    while len(view.nvim.appends) < 3:
+        time.sleep(0.01)
+    # the second toggle cancels it
+    engine.toggle(text)
+    _wait_until_done(engine)
+    appends = [appended for _, appended in view.nvim.appends]
+    assert len(appends) < 50
+    assert appends[-1] == "\n\n>>> user\n\n"
+
+
+def test_engine_only_completes_aichat(llm_server):
+    buffer = _FakeBuffer(1, ["q"])
+    engine, view = _make_engine([buffer])
+    messages = []
+    view.msg = messages.append
+    engine.toggle(SimpleNamespace(buffer=buffer, filename="1.md"))
+    assert not engine.is_running(1)
+    assert messages == ["completion only works in .aichat texts"]
+    assert not llm_server.requests
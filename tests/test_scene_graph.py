@@ -0,0 +1,81 @@
+from infinote.scene_graph import SceneGraph
+
+
+class _FakeText:
+    def __init__(self, name):
+        self.name = name
+        self.invalidations = 0
+
+    def invalidate_plane_scale(self):
+        self.invalidations += 1
+
+    def __repr__(self):
+        return self.name
+
+
+def _make_tree():
+    # a -> b -> d, a -> c, e
+    graph = SceneGraph()
+    a, b, c, d, e = (_FakeText(name) for name in "abcde")
+    graph.add(a)
+    graph.add(b, parent=a)
+    graph.add(c, parent=a)
+    graph.add(d, parent=b)
+    graph.add(e)
+    return graph, a, b, c, d, e
+
+
+def test_relations():
+    graph, a, b, c, d, e = _make_tree()
+    assert graph.get_roots() == [a, e]
+    assert graph.get_children(a) == [b, c]
+    assert graph.get_parent(d) is b
+    assert graph.get_parent(a) is None
+    assert graph.get_root(d) is a
+    assert [graph.get_depth(text) for text in (a, b, d)] == [0, 1, 2]
+
+
+def test_reparent():
+    graph, a, b, c, d, e = _make_tree()
+    before = d.invalidations
+    graph.set_parent(b, e)
+    # the subtree moves along, and is appended after the existing children
+    assert graph.get_children(a) == [c]
+    assert graph.get_children(e) == [b]
+    assert graph.get_root(d) is e
+    assert b.invalidations == before + 1
+
+    graph.set_parent(c, e)
+    assert graph.get_children(e) == [b, c]
+    graph.reparent([b, c], a)
+    assert graph.get_children(a) == [b, c]
+    assert graph.get_roots() == [a, e]
+
+
+def test_detach():
+    graph, a, b, c, d, e = _make_tree()
+    graph.detach(b)
+    assert graph.get_parent(b) is None
+    assert graph.get_children(a) == [c]
+    assert graph.get_roots() == [a, e, b]
+    assert graph.get_children(b) == [d]
+    # detaching a root does nothing
+    invalidations = b.invalidations
+    graph.detach(b)
+    assert b.invalidations == invalidations
+    assert graph.get_roots() == [a, e, b]
+
+
+def test_remove():
+    graph, a, b, c, d, e = _make_tree()
+    graph.remove(b)
+    assert b not in graph
+    assert graph.get_parent(b) is None
+    assert graph.get_children(b) == []
+    # its children become roots
+    assert graph.get_parent(d) is None
+    assert graph.get_roots() == [a, e, d]
+    assert graph.get_children(a) == [c]
+
+    graph.remove(a)
+    assert graph.get_roots() == [e, d, c]
@@ -0,0 +1,138 @@
+import math
+import random
+
+import pytest
+
+from infinote.spatial_index import SpatialIndex, _center, _in_direction
+
+
+def _random_rect(rng):
+    # box sizes spanning several orders of magnitude, like with autoshrink
+    size = 10 ** rng.uniform(-2, 3)
+    x, y = rng.uniform(-5000, 5000), rng.uniform(-5000, 5000)
+    return (x, y, x + size * 4, y + size * rng.uniform(0.1, 4))
+
+
+def _brute_query(rects, rect):
+    return {
+        item
+        for item, r in rects.items()
+        if r[0] <= rect[2] and rect[0] <= r[2] and r[1] <= rect[3] and rect[1] <= r[3]
+    }
+
+
+def _brute_nearest_distance(rects, point, direction, exclude):
+    # the distance to the nearest center in that direction, or None if there is none
+    distances = []
+    for item, rect in rects.items():
+        if item is exclude:
+            continue
+        x, y = _center(rect)
+        if _in_direction((x - point[0], y - point[1]), direction):
+            distances.append(math.dist((x, y), point))
+    return min(distances, default=None)
+
+
+def _max_depth(node):
+    if node.children is None:
+        return 0
+    return 1 + max(_max_depth(child) for child in node.children)
+
+
+@pytest.fixture
+def populated():
+    # an index after random inserts, moves and removes, with the rects it should hold
+    rng = random.Random(1)
+    index = SpatialIndex()
+    rects = {}
+    items = [object() for _ in range(300)]
+    for _ in range(3000):
+        item = rng.choice(items)
+        if rng.random() < 0.8:
+            rects[item] = _random_rect(rng)
+            index.update(item, rects[item])
+        else:
+            rects.pop(item, None)
+            index.remove(item)
+    return index, rects, items, rng
+
+
+# query
+
+
+def test_query_matches_brute_force(populated):
+    index, rects, _, rng = populated
+    for _ in range(200):
+        rect = _random_rect(rng)
+        assert index.query(rect) == _brute_query(rects, rect)
+    # the whole plane
+    assert index.query((-1e9, -1e9, 1e9, 1e9)) == set(rects)
+
+
+def test_empty_index():
+    index = SpatialIndex()
+    assert index.query((0, 0, 1, 1)) == set()
+    assert index.nearest_in_direction((0, 0), "down") is None
+
+
+# nearest_in_direction
+
+
+def test_nearest_in_direction_matches_brute_force(populated):
+    index, rects, items, rng = populated
+    for _ in range(100):
+        point = (rng.uniform(-5000, 5000), rng.uniform(-5000, 5000))
+        exclude = rng.choice(items)
+        for direction in ["up", "down", "left", "right"]:
+            found = index.nearest_in_direction(point, direction, exclude=exclude)
+            expected = _brute_nearest_distance(rects, point, direction, exclude)
+            if expected is None:
+                assert found is None
+            else:
+                # (ties can be broken either way, so the distances are compared)
+                assert found is not exclude and found in rects
+                assert math.isclose(math.dist(_center(rects[found]), point), expected)
+
+
+def test_nearest_in_direction_skips_excluded():
+    index = SpatialIndex()
+    near, far = object(), object()
+    index.update(near, (0, 10, 1, 11))
+    index.update(far, (0, 100, 1, 101))
+    assert index.nearest_in_direction((0.5, 0), "down") is near
+    assert index.nearest_in_direction((0.5, 0), "down", exclude=near) is far
+    assert index.nearest_in_direction((0.5, 0), "up") is None
+
+
+# degenerate sizes
+
+
+def test_degenerate_rects_bound_the_depth():
+    # many zero-size rects at one point can't be separated by splitting,
+    # so the depth must stay bounded
+    index = SpatialIndex()
+    points = [object() for _ in range(50)]
+    for item in points:
+        index.update(item, (3, 3, 3, 3))
+    # the root only grows, so no node can get smaller than this fraction of the first one
+    first_root_width = index._root.rect[2] - index._root.rect[0]
+    # tiny boxes next to a huge one, as with autoshrink far from the origin
+    rng = random.Random(2)
+    rects = {item: (3, 3, 3, 3) for item in points}
+    for _ in range(200):
+        item = object()
+        x, y = rng.uniform(0, 1e-6), rng.uniform(0, 1e-6)
+        rects[item] = (x, y, x + 1e-9, y + 1e-9)
+        index.update(item, rects[item])
+    huge = object()
+    rects[huge] = (-1e6, -1e6, 1e6, 1e6)
+    index.update(huge, rects[huge])
+
+    root_width = index._root.rect[2] - index._root.rect[0]
+    min_width = first_root_width * index._min_node_fraction
+    assert _max_depth(index._root) <= math.log2(root_width / min_width) + 1
+
+    assert index.query((3, 3, 3, 3)) == _brute_query(rects, (3, 3, 3, 3))
+    assert index.query((0, 0, 1e-6, 1e-6)) == _brute_query(rects, (0, 0, 1e-6, 1e-6))
+    found = index.nearest_in_direction((3, 0), "down", exclude=huge)
+    assert found in points
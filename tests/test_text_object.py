@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+from infinote.text_object import TextboxInsidesRenderer  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def qapp():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture(params=["widget", "painter"])
+def make_renderer(qapp, request):
+    def make(folds=()):
+        return TextboxInsidesRenderer(0, list(folds), [], backend=request.param)
+
+    return make
+
+
+def _render(renderer, lines, folds=()):
+    renderer.folds = list(folds)
+    # (update_text modifies the lines)
+    renderer.update_text(list(lines), [])
+
+
+def _document_state(renderer):
+    blocks = list(renderer._get_blocks())
+    return [block.text() for block in blocks], [block.isVisible() for block in blocks]
+
+
+def _assert_rendered(renderer):
+    # the patched document must be the same as one rendered from scratch
+    texts, visible = _document_state(renderer)
+    assert texts == renderer.display.displayed_lines
+    assert visible == renderer.display.visible
+    assert renderer._visible == renderer.display.visible
+
+
+# _patch_document
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        # replace
+        (["a", "b", "c"], ["a", "x", "c"]),
+        (["a", "b", "c"], ["x", "b", "y"]),
+        # insert at the start, in the middle, at the end
+        (["a", "b"], ["x", "a", "b"]),
+        (["a", "b"], ["a", "x", "y", "b"]),
+        (["a", "b"], ["a", "b", "x"]),
+        # delete at the start, in the middle, at the end
+        (["a", "b", "c"], ["b", "c"]),
+        (["a", "b", "c", "d"], ["a", "d"]),
+        (["a", "b", "c"], ["a", "b"]),
+        # repeated lines make the common prefix and suffix overlap
+        (["a", "a", "a"], ["a", "a"]),
+        (["a", "a"], ["a", "a", "a"]),
+        # empty lines
+        (["a", "", "b"], ["a", "b", ""]),
+    ],
+)
+def test_patch_matches_full_render(make_renderer, old, new):
+    renderer = make_renderer()
+    _render(renderer, old)
+    _render(renderer, new)
+    _assert_rendered(renderer)
+
+
+def test_patch_returns_only_changed_blocks(make_renderer):
+    renderer = make_renderer()
+    renderer._patch_document(["a", "b", "c", "d"])
+    assert renderer._patch_document(["a", "x", "c", "d"]) == {1}
+    assert renderer._patch_document(["a", "x", "y", "z", "c", "d"]) == {2, 3}
+    assert renderer._patch_document(["a", "d"]) == set()
+    assert renderer._patch_document(["a", "d"]) == set()
+
+
+@pytest.mark.parametrize(
+    "old, new, folds",
+    [
+        # edit inside a closed fold (folds are 1-based and inclusive)
+        (["a", "b", "c", "d"], ["a", "b", "x", "d"], [[2, 3]]),
+        # insert before a fold, so the hidden lines shift
+        (["a", "b", "c", "d"], ["x", "a", "b", "c", "d"], [[3, 4]]),
+        # delete the fold head
+        (["a", "b", "c", "d"], ["a", "c", "d"], [[2, 3]]),
+        # delete the hidden lines, with the last line hidden
+        (["a", "b", "c", "d"], ["a", "b"], [[2, 4]]),
+        # insert after the hidden last line
+        (["a", "b", "c"], ["a", "b", "c", "x"], [[2, 3]]),
+    ],
+)
+def test_patch_with_folds(make_renderer, old, new, folds):
+    renderer = make_renderer()
+    _render(renderer, old, folds)
+    _assert_rendered(renderer)
+    _render(renderer, new, folds)
+    _assert_rendered(renderer)
+    # and the fold opened again
+    _render(renderer, new)
+    _assert_rendered(renderer)
+    assert all(renderer.display.visible)
+
+
+def test_patch_with_outline(make_renderer):
+    renderer = make_renderer()
+    renderer.outline = True
+    _render(renderer, ["- a", "  hidden", "- b"])
+    _assert_rendered(renderer)
+    assert renderer.display.visible == [True, False, True]
+    # a new hidden line between the hidden and the shown one
+    _render(renderer, ["- a", "  hidden", "  new", "- b"])
+    _assert_rendered(renderer)
+    # an indented line unindented, so it's shown
+    _render(renderer, ["- a", "hidden", "  new", "- b"])
+    _assert_rendered(renderer)